@@ -0,0 +1,174 @@
+# NumPy versions of sun_angles and view_angles for angle grids computed locally
+
+import datetime
+import math
+import sys
+import time
+
+import numpy as np
+
+# same corner order and swath half angle as utils, which needs ee
+UPPER_LEFT = 0
+LOWER_LEFT = 1
+LOWER_RIGHT = 2
+UPPER_RIGHT = 3
+MAX_SATELLITE_ZENITH = 7.5
+
+# pixels evaluated at once; bounds the float64 temporaries
+CHUNK_SIZE = 1 << 20
+
+
+def _chunks(n, chunkSize):
+    for start in range(0, n, chunkSize):
+        yield slice(start, min(start + chunkSize, n))
+
+
+def inside(footprint, lon, lat):
+    """Boolean array, True for the points inside the footprint polygon (ray casting)."""
+    result = np.zeros(lon.shape, dtype=bool)
+    n = len(footprint)
+    for i in range(n):
+        x1, y1 = footprint[i]
+        x2, y2 = footprint[(i + 1) % n]
+        if y1 == y2:
+            continue
+        crosses = (y1 > lat) != (y2 > lat)
+        xCross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+        result ^= crosses & (lon < xCross)
+    return result
+
+
+def sun(date, footprint, lon, lat, chunkSize=CHUNK_SIZE):
+    """(sunAz, sunZen) in radians as sun_angles.create; NaN outside the footprint.
+
+    date is a datetime in UTC, footprint a list of [lon, lat] corners and lon,
+    lat arrays of the same shape in degrees.
+    """
+    yearStart = datetime.datetime(date.year, 1, 1)
+    yearLength = (datetime.datetime(date.year + 1, 1, 1) - yearStart).total_seconds()
+    jdp = (date - yearStart).total_seconds() / yearLength
+    hourGMT = (date - datetime.datetime(date.year, date.month, date.day)).total_seconds() / 3600
+
+    # Julian day proportion in radians
+    jdpr = jdp * math.pi * 2
+
+    a = [0.000075, 0.001868, 0.032077, 0.014615, 0.040849]
+    localSolarDiff = (a[0] + a[1] * math.cos(jdpr) - a[2] * math.sin(jdpr)
+                      - a[3] * math.cos(2 * jdpr) - a[4] * math.sin(2 * jdpr)) * 12 * 60 / math.pi
+
+    b = [0.006918, 0.399912, 0.070257, 0.006758, 0.000907, 0.002697, 0.001480]
+    delta = b[0] - b[1] * math.cos(jdpr) + b[2] * math.sin(jdpr) \
+        - b[3] * math.cos(2 * jdpr) + b[4] * math.sin(2 * jdpr) \
+        - b[5] * math.cos(3 * jdpr) + b[6] * math.sin(3 * jdpr)
+
+    lon = np.asarray(lon)
+    lat = np.asarray(lat)
+    sunAz = np.empty(lon.shape, dtype=np.float32)
+    sunZen = np.empty(lon.shape, dtype=np.float32)
+    flatLon, flatLat = lon.ravel(), lat.ravel()
+    flatAz, flatZen = sunAz.reshape(-1), sunZen.reshape(-1)
+
+    for part in _chunks(flatLon.size, chunkSize):
+        longDeg = flatLon[part].astype(np.float64)
+        latRad = np.radians(flatLat[part].astype(np.float64))
+
+        trueSolarTime = longDeg / 15.0 + hourGMT + localSolarDiff / 60 - 12.0
+
+        # Hour as an angle
+        ah = trueSolarTime * math.radians(MAX_SATELLITE_ZENITH * 2)
+        cosSunZen = np.sin(latRad) * math.sin(delta) + np.cos(latRad) * np.cos(ah) * math.cos(delta)
+        zen = np.arccos(np.clip(cosSunZen, -1.0, 1.0))
+
+        # sun azimuth from south, turning west
+        sinSunAzSW = np.clip(np.sin(ah) * math.cos(delta) / np.sin(zen), -1.0, 1.0)
+        cosSunAzSW = (-np.cos(latRad) * math.sin(delta) + np.sin(latRad) * math.cos(delta) * np.cos(ah)) / np.sin(zen)
+        sunAzSW = np.arcsin(sinSunAzSW)
+        sunAzSW = np.where(cosSunAzSW <= 0, math.pi - sunAzSW, sunAzSW)
+        sunAzSW = np.where((cosSunAzSW > 0) & (sinSunAzSW <= 0), sunAzSW + 2 * math.pi, sunAzSW)
+
+        az = sunAzSW + math.pi
+        # Keep within [0, 2pi] range
+        az = np.where(az > 2 * math.pi, az - 2 * math.pi, az)
+
+        outside = ~inside(footprint, flatLon[part], flatLat[part])
+        az[outside] = np.nan
+        zen[outside] = np.nan
+        flatAz[part] = az
+        flatZen[part] = zen
+
+    return (sunAz, sunZen)
+
+
+def view(footprint, lon, lat, chunkSize=CHUNK_SIZE):
+    """(viewAz, viewZen) in radians as view_angles.create with the analytic zenith."""
+    upperCenter = [(footprint[UPPER_LEFT][i] + footprint[UPPER_RIGHT][i]) / 2.0 for i in (0, 1)]
+    lowerCenter = [(footprint[LOWER_LEFT][i] + footprint[LOWER_RIGHT][i]) / 2.0 for i in (0, 1)]
+    slope = (lowerCenter[1] - upperCenter[1]) / (lowerCenter[0] - upperCenter[0])
+    azimuth = math.pi / 2 - math.atan(-1.0 / slope)
+
+    meanLat = sum(footprint[i][1] for i in (UPPER_LEFT, LOWER_LEFT, LOWER_RIGHT, UPPER_RIGHT)) / 4
+    lonScale = math.cos(math.radians(meanLat))
+
+    def distance(px, py, fromIndex, toIndex):
+        (x1, y1), (x2, y2) = footprint[fromIndex], footprint[toIndex]
+        dx = (x2 - x1) * lonScale
+        dy = y2 - y1
+        return np.abs((px - x1) * lonScale * dy - (py - y1) * dx) / math.hypot(dx, dy)
+
+    lon = np.asarray(lon)
+    lat = np.asarray(lat)
+    viewAz = np.full(lon.shape, azimuth, dtype=np.float32)
+    viewZen = np.empty(lon.shape, dtype=np.float32)
+    flatLon, flatLat = lon.ravel(), lat.ravel()
+    flatAz, flatZen = viewAz.reshape(-1), viewZen.reshape(-1)
+
+    for part in _chunks(flatLon.size, chunkSize):
+        px = flatLon[part].astype(np.float64)
+        py = flatLat[part].astype(np.float64)
+        leftDistance = distance(px, py, UPPER_LEFT, LOWER_LEFT)
+        rightDistance = distance(px, py, UPPER_RIGHT, LOWER_RIGHT)
+        zen = np.radians(rightDistance * MAX_SATELLITE_ZENITH * 2 / (rightDistance + leftDistance)
+                         - MAX_SATELLITE_ZENITH)
+
+        outside = ~inside(footprint, px, py)
+        zen[outside] = np.nan
+        flatAz[part] = np.where(outside, np.nan, flatAz[part])
+        flatZen[part] = zen
+
+    return (viewAz, viewZen)
+
+
+def create(date, footprint, lon, lat, chunkSize=CHUNK_SIZE):
+    """Dict of float32 sunAz, sunZen, viewAz and viewZen arrays (radians) on the lon/lat grid."""
+    (sunAz, sunZen) = sun(date, footprint, lon, lat, chunkSize)
+    (viewAz, viewZen) = view(footprint, lon, lat, chunkSize)
+    return {'sunAz': sunAz, 'sunZen': sunZen, 'viewAz': viewAz, 'viewZen': viewZen}
+
+
+def grid(footprint, shape):
+    """lon, lat arrays of the given (rows, columns) covering the footprint bounds, north up."""
+    lons = [c[0] for c in footprint]
+    lats = [c[1] for c in footprint]
+    lat, lon = np.meshgrid(np.linspace(max(lats), min(lats), shape[0]),
+                           np.linspace(min(lons), max(lons), shape[1]), indexing='ij')
+    return lon, lat
+
+
+if __name__ == "__main__":
+
+    # python angles_numpy.py [pixels per side]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # a Landsat-like swath over Ecuador, tilted as a descending path
+    footprint = [[-79.05, -0.55], [-79.45, -2.20], [-77.80, -2.55], [-77.40, -0.90], [-79.05, -0.55]]
+    date = datetime.datetime(2018, 8, 14, 15, 20, 31)
+    lon, lat = grid(footprint, (size, size))
+
+    start = time.time()
+    angles = create(date, footprint, lon, lat)
+    elapsed = time.time() - start
+
+    print("%d pixels in %.2fs (%.0f pixels/s)" % (lon.size, elapsed, lon.size / elapsed))
+    for name in ['sunAz', 'sunZen', 'viewAz', 'viewZen']:
+        values = np.degrees(angles[name][np.isfinite(angles[name])])
+        print("%s: %.3f .. %.3f degrees" % (name, values.min(), values.max()))
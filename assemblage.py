@@ -1,22 +1,159 @@
 
 
+# assemblage package
+
+import ee
+import json
+import time
+import numpy as np
+from utils import collection_to_bands, graph_depth
+
+# compiled trees per nodeStruct (as sorted JSON)
+_trees = {}
+
+
+def compileTree(nodeStruct, startId='key1', names=None):
+	""" flat arrays of a nodeStruct decision tree, node 0 being startId.
+	band indexes tree['bands'], left/right hold the child node, or -(leaf + 1)
+	for a leaf of tree['classes']; a node sends values >= threshold left.
+	With the band names of the image, split bands and leaf classes other than
+	'other' that are not among them raise a ValueError """
+	key = json.dumps(nodeStruct, sort_keys=True) + startId
+	if key not in _trees:
+		_trees[key] = buildTree(nodeStruct, startId)
+	tree = _trees[key]
+	
+	if names is not None:
+		unknown = [name for name in tree['bands'] + tree['classes'] if name != 'other' and name not in names]
+		if unknown:
+			raise ValueError("tree refers to bands not in the image: " + ", ".join(sorted(set(unknown))))
+	return tree
+
+
+def buildTree(nodeStruct, startId):
+	""" the arrays of compileTree, uncached and unchecked """
+	tree = {'bands': [], 'classes': [], 'band': [], 'threshold': [], 'left': [], 'right': []}
+	
+	def index(values, value):
+		if value not in values:
+			values.append(value)
+		return values.index(value)
+	
+	def add(id1):
+		node = len(tree['band'])
+		dict1 = nodeStruct[id1]
+		tree['band'].append(index(tree['bands'], dict1['band']))
+		tree['threshold'].append(dict1['threshold'])
+		tree['left'].append(None)
+		tree['right'].append(None)
+		for side in ['left', 'right']:
+			if dict1[side] == 'terminal':
+				tree[side][node] = -index(tree['classes'], dict1[side + 'Name']) - 1
+			else:
+				tree[side][node] = add(dict1[side])
+		return node
+	
+	add(startId)
+	return tree
+
+
+def evaluateTreeNumpy(tree, values):
+	""" leaf index for values (band, ...) with the bands of tree['bands'], all samples advanced a level at a time """
+	band = np.array(tree['band'])
+	threshold = np.array(tree['threshold'], dtype=np.float64)
+	left = np.array(tree['left'])
+	right = np.array(tree['right'])
+	
+	flat = values.reshape(values.shape[0], -1)
+	node = np.zeros(flat.shape[1], dtype=np.int64)
+	active = np.arange(flat.shape[1])
+	while active.size:
+		current = node[active]
+		step = np.where(flat[band[current], active] >= threshold[current], left[current], right[current])
+		node[active] = step
+		active = active[step >= 0]
+	return (-node - 1).reshape(values.shape[1:])
+
 class assemblage():
 
 	def __init__(self):
 		pass
 		
-	def createAssemblage(self,image,nodeStruct):
+	def createAssemblage(self,image,nodeStruct,sd=10,nIter=100,seed=0,names=None):
+		""" Monte Carlo assemblage: the decision tree is applied to nIter perturbed copies of image.
+		All iterations are evaluated at once on nIter band images; returns the most frequent
+		class (mode) and the number of iterations agreeing with it (prob).
+		Bands and leaves of the tree missing from image fail when the result is computed;
+		pass the band names of image as names to check them before building the graph """
+		
+		tree = compileTree(nodeStruct, names=names)
+		
+		# uniform noise in [-sd, sd], one band per iteration and a different seed per (band, iteration)
+		perturbed = []
+		for j, name in enumerate(tree['bands']):
+			noise = ee.Image.cat([ee.Image.random(seed + j * nIter + i) for i in range(nIter)])
+			perturbed.append(image.select([name]).add(noise.subtract(0.5).multiply(2 * sd)))
+		
+		# class numbers as in the classifier: 0 is 'other', then the bands of image in order;
+		# the select fails on the server for a leaf that is not a band of image
+		bandNames = image.bandNames()
+		numbers = [ee.Number(0) if name == 'other' else bandNames.indexOf(image.select([name]).bandNames().get(0)).add(1)
+				   for name in tree['classes']]
+		
+		leaves = self.evaluateTree(tree,0,perturbed,nIter)
+		return self.modeAndAgreement(leaves,numbers)
 
-		names = image.bandNames().getInfo()
-		classes = ['other']
+	def evaluateTree(self,tree,node,perturbed,nIter):
+		""" leaf (index into tree['classes']) of every iteration as a where cascade of threshold comparisons """
+		
+		def branch(child):
+			if child < 0:
+				return ee.Image.constant([-child - 1] * nIter)
+			return self.evaluateTree(tree,child,perturbed,nIter)
+		
+		condition = perturbed[tree['band'][node]].gte(tree['threshold'][node])
+		return branch(tree['right'][node]).where(condition, branch(tree['left'][node]))
 
-		for name in names:
-			classes.append(name.encode('ascii'))
-		numbers = range(0,image.bandNames().length().getInfo()+1,1)
+	def modeAndAgreement(self,leaves,numbers):
+		""" mode over the iteration bands and its count, from one count per leaf class;
+		ties go to the smallest class number, as with ImageCollection.mode(): the argmax
+		runs over count * 1000 - class number """
+		counts = ee.Image.cat([leaves.eq(c).reduce(ee.Reducer.sum()) for c in range(len(numbers))])
+		scores = counts.multiply(1000).subtract(ee.Image.constant(ee.List(numbers)))
+		mode = scores.toArray().arrayArgmax().arrayGet([0]) \
+					 .remap(list(range(len(numbers))), ee.List(numbers)).rename('classification')
+		prob = counts.reduce(ee.Reducer.max()).rename('prob')
+		return mode, prob
+
+	def createAssemblageNumpy(self,stack,names,nodeStruct,sd=10,nIter=100,seed=0,chunkRows=64):
+		""" createAssemblage on a local (band, y, x) array with band names; returns mode and prob arrays """
+		tree = compileTree(nodeStruct, names=names)
+		numbers = np.array([0 if name == 'other' else names.index(name) + 1 for name in tree['classes']])
+		order = np.argsort(numbers, kind='stable')
+		used = [names.index(name) for name in tree['bands']]
+		rng = np.random.RandomState(seed)
+		nRows, nCols = stack.shape[1:]
+		mode = np.zeros((nRows, nCols), dtype=np.uint8)
+		prob = np.zeros((nRows, nCols), dtype=np.uint16)
+		
+		for start in range(0, nRows, chunkRows):
+			rows = slice(start, min(start + chunkRows, nRows))
+			tile = stack[used, rows].astype(np.float32)
+			perturbed = tile[:, None] + rng.uniform(-sd, sd, size=(len(used), nIter) + tile.shape[1:]).astype(np.float32)
+			leaves = evaluateTreeNumpy(tree,perturbed)
+			counts = np.stack([(leaves == c).sum(axis=0) for c in order])
+			mode[rows] = numbers[order][counts.argmax(axis=0)]
+			prob[rows] = counts.max(axis=0)
 		
-		classStruct = {}
-		for i in numbers:
-			classStruct[classes[i]] = {'number' : i}
+		return mode, prob
+
+	def createAssemblageClassifier(self,image,nodeStruct):
+		""" createAssemblage with ee.Classifier.decisionTree, one classified image per iteration """
+
+		names = image.bandNames().getInfo()
+		classStruct = {'other': {'number': 0}}
+		for i, name in enumerate(names):
+			classStruct[name] = {'number': i + 1}
 		
 		# The starting id, i.e. the first decision
 		startId = 'key1';
@@ -117,33 +254,42 @@ class assemblage():
 		return DTstring;
 
 	def collectionToImage(self,collection):
-		
-		def iterate(img,prev):
-			return ee.Image(prev).addBands(img)
-		
-		stack = ee.Image(collection.iterate(iterate,ee.Image(1)))
-		 
-		stack = stack.select(ee.List.sequence(1, stack.bandNames().size().subtract(1)));
-		
-		return stack;
+		""" stack the images of collection as bands, keeping their band names """
+		return collection_to_bands(collection)
 
-		
-import ee
-ee.Initialize()
 
+if __name__ == "__main__":
 
-aquaculture = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/aquaculture").first()).rename('aquaculture')
-barren = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/barren").first()).rename('barren')
-cropland = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/cropland").first()).rename('cropland')
-deciduous = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/deciduous").first()).rename('forest')
-		
-image = aquaculture.addBands(barren).addBands(cropland).addBands(deciduous)
+	ee.Initialize()
 
-nodeStruct = { 	'key1':  {'band': 'aquaculture','threshold': 50, 'left': 'terminal', 'leftName': 'aquaculture', 'right': 'key2'},
-				'key2':  {'band': 'barren', 'threshold': 40, 'left': 'terminal', 'leftName': 'barren', 'right': 'key3'},
-				'key3':  {'band': 'cropland', 'threshold': 60, 'left': 'terminal', 'leftName': 'cropland', 'right': 'key4'},
-				'key4':  {'band': 'forest', 'threshold': 5, 'left': 'terminal', 'leftName': 'other', 'right': 'terminal', 'rightName': 'forest'}	};
+	aquaculture = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/aquaculture").first()).rename('aquaculture')
+	barren = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/barren").first()).rename('barren')
+	cropland = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/cropland").first()).rename('cropland')
+	deciduous = ee.Image(ee.ImageCollection("projects/servir-mekong/yearly_primitives_smoothed/deciduous").first()).rename('forest')
 
-m,p = assemblage().createAssemblage(image,nodeStruct)
-print(m.getInfo())
-print(p.getInfo())
+	image = aquaculture.addBands(barren).addBands(cropland).addBands(deciduous)
+
+	nodeStruct = { 	'key1':  {'band': 'aquaculture','threshold': 50, 'left': 'terminal', 'leftName': 'aquaculture', 'right': 'key2'},
+					'key2':  {'band': 'barren', 'threshold': 40, 'left': 'terminal', 'leftName': 'barren', 'right': 'key3'},
+					'key3':  {'band': 'cropland', 'threshold': 60, 'left': 'terminal', 'leftName': 'cropland', 'right': 'key4'},
+					'key4':  {'band': 'forest', 'threshold': 5, 'left': 'terminal', 'leftName': 'other', 'right': 'terminal', 'rightName': 'forest'}	};
+
+	# compiled tree against the decision tree string classifier
+	region = ee.Geometry.Polygon([[103.876,18.552],[105.806,18.552],[105.806,19.999],[103.876,19.999],[103.876,18.552]])
+	for name, method in [('compiled', assemblage().createAssemblage), ('classifier', assemblage().createAssemblageClassifier)]:
+		start = time.time()
+		m,p = method(image,nodeStruct)
+		stats = m.addBands(p).reduceRegion(reducer=ee.Reducer.mean(), geometry=region, scale=300, maxPixels=1e13).getInfo()
+		print("%s: %.1fs %s" % (name, time.time() - start, stats))
+
+	# stacking depth: serial iterate over addBands against toBands
+	def iterateStack(collection):
+		stack = ee.Image(collection.iterate(lambda img, prev: ee.Image(prev).addBands(img), ee.Image(1)))
+		return stack.select(ee.List.sequence(1, stack.bandNames().size().subtract(1)))
+	
+	bands = ee.ImageCollection([image.select([i]) for i in range(4)] * 25)
+	for name, method in [('iterate', iterateStack), ('toBands', lambda collection: collection_to_bands(collection, False))]:
+		stack = method(bands)
+		start = time.time()
+		stack.reduceRegion(reducer=ee.Reducer.mean(), geometry=region, scale=300, maxPixels=1e13).getInfo()
+		print("%s: graph depth %d, %.1fs" % (name, graph_depth(stack), time.time() - start))
@@ -0,0 +1,301 @@
+# 6S atmospheric correction helpers for Sentinel-2
+
+import ee
+import datetime
+import math
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Py6S import *
+sys.path.append("/gee-atmcorr-S2/bin")
+from atmospheric import Atmospheric
+
+S2_BANDS = ['B1','B2','B3','B4','B5','B6','B7','B8','B8A','B9','B10','B11','B12']
+
+SPECTRAL_RESPONSE = {
+    'B1': PredefinedWavelengths.S2A_MSI_01,
+    'B2': PredefinedWavelengths.S2A_MSI_02,
+    'B3': PredefinedWavelengths.S2A_MSI_03,
+    'B4': PredefinedWavelengths.S2A_MSI_04,
+    'B5': PredefinedWavelengths.S2A_MSI_05,
+    'B6': PredefinedWavelengths.S2A_MSI_06,
+    'B7': PredefinedWavelengths.S2A_MSI_07,
+    'B8': PredefinedWavelengths.S2A_MSI_08,
+    'B8A': PredefinedWavelengths.S2A_MSI_09,
+    'B9': PredefinedWavelengths.S2A_MSI_10,
+    'B10': PredefinedWavelengths.S2A_MSI_11,
+    'B11': PredefinedWavelengths.S2A_MSI_12,
+    'B12': PredefinedWavelengths.S2A_MSI_13}
+
+
+def scene_date(meta):
+    # i.e. Python uses seconds, EE uses milliseconds
+    return datetime.datetime.utcfromtimestamp(meta['system:time_start'] / 1000)
+
+
+def conditions(scenes):
+    """Water vapour, ozone, aerosol optical thickness and altitude (km) at each scene centroid.
+
+    scenes maps system:index -> properties; everything is fetched with one getInfo().
+    """
+    features = []
+    for sceneId, meta in scenes.items():
+        date = scene_date(meta)
+        geom = ee.Geometry(meta['system:footprint']).centroid()
+        day = ee.Date.fromYMD(date.year, date.month, date.day)
+        features.append(ee.Feature(geom, {'id': sceneId,
+                                          'h2o': Atmospheric.water(geom, day),
+                                          'o3': Atmospheric.ozone(geom, day),
+                                          'aot': Atmospheric.aerosol(geom, day)}))
+
+    # Shuttle Radar Topography mission covers *most* of the Earth
+    SRTM = ee.Image('CGIAR/SRTM90_V4')
+    centroids = SRTM.reduceRegions(collection=ee.FeatureCollection(features),
+                                   reducer=ee.Reducer.mean().setOutputs(['elevation']),
+                                   scale=90)
+    rows = centroids.select(['id', 'h2o', 'o3', 'aot', 'elevation'], None, False).getInfo()['features']
+
+    states = {}
+    for row in rows:
+        p = row['properties']
+        alt = p.get('elevation')
+        # i.e. Py6S uses units of kilometers
+        km = alt / 1000 if alt else 0
+        states[p['id']] = {'h2o': p['h2o'], 'o3': p['o3'], 'aot': p['aot'], 'km': km}
+    return states
+
+
+# step sizes used to quantize the atmospheric state before running 6S;
+# scenes falling in the same bin share one 6S run per band
+QUANTIZATION = {'solar_z': 0.25, 'h2o': 0.1, 'o3': 0.01, 'aot': 0.01, 'km': 0.05}
+
+
+def _round(value, step):
+    return round(round(value / step) * step, 6)
+
+
+def quantize(band, solar_z, state, date):
+    """Cache key (band, solar_z, h2o, o3, aot, km, month, day) for one 6S run."""
+    q = QUANTIZATION
+    return (band,
+            _round(solar_z, q['solar_z']),
+            _round(state['h2o'], q['h2o']),
+            _round(state['o3'], q['o3']),
+            _round(state['aot'], q['aot']),
+            _round(state['km'], q['km']),
+            date.month,
+            date.day)
+
+
+def run_6s(key):
+    """Run 6S for one quantized key, returns (Edir, Edif, Lp, tau2)."""
+    band, solar_z, h2o, o3, aot, km, month, day = key
+
+    s = SixS()
+
+    # Atmospheric constituents
+    s.atmos_profile = AtmosProfile.UserWaterAndOzone(h2o, o3)
+    s.aero_profile = AeroProfile.Continental
+    s.aot550 = aot
+
+    # Earth-Sun-satellite geometry
+    s.geometry = Geometry.User()
+    s.geometry.view_z = 0               # always NADIR (I think..)
+    s.geometry.solar_z = solar_z        # solar zenith angle
+    s.geometry.month = month            # month and day used for Earth-Sun distance
+    s.geometry.day = day                # month and day used for Earth-Sun distance
+    s.altitudes.set_sensor_satellite_level()
+    s.altitudes.set_target_custom_altitude(km)
+
+    s.wavelength = Wavelength(SPECTRAL_RESPONSE[band])
+    s.run()
+
+    Edir = s.outputs.direct_solar_irradiance             # direct solar irradiance
+    Edif = s.outputs.diffuse_solar_irradiance            # diffuse solar irradiance
+    Lp = s.outputs.atmospheric_intrinsic_radiance        # path radiance
+    absorb = s.outputs.trans['global_gas'].upward        # absorption transmissivity
+    scatter = s.outputs.trans['total_scattering'].upward # scattering transmissivity
+    tau2 = absorb * scatter                              # total transmissivity
+
+    return (Edir, Edif, Lp, tau2)
+
+
+class SixSCache(object):
+    """On-disk (SQLite) store of 6S outputs with LRU eviction.
+
+    Hits only bump the LRU stamp in memory; the stamps are written in one
+    transaction by put, flush and close. Use as a context manager to close
+    the connection even when 6S fails.
+    """
+
+    def __init__(self, path, maxEntries=200000):
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS sixs (key TEXT PRIMARY KEY, edir REAL, edif REAL, lp REAL, tau2 REAL, used INTEGER)")
+        self._db.commit()
+        self._clock = self._db.execute("SELECT COALESCE(MAX(used), 0) FROM sixs").fetchone()[0]
+        self._used = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, key):
+        return "|".join(str(k) for k in key)
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT edir, edif, lp, tau2 FROM sixs WHERE key = ?", (self._key(key),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._used[self._key(key)] = self._clock
+            return tuple(row)
+
+    def _write_used(self):
+        if self._used:
+            self._db.executemany("UPDATE sixs SET used = ? WHERE key = ?", [(used, key) for key, used in self._used.items()])
+            self._used = {}
+
+    def put(self, key, outputs):
+        with self._lock:
+            self._write_used()
+            self._clock += 1
+            self._db.execute("INSERT OR REPLACE INTO sixs VALUES (?, ?, ?, ?, ?, ?)",
+                             (self._key(key),) + tuple(outputs) + (self._clock,))
+            excess = self._db.execute("SELECT COUNT(*) FROM sixs").fetchone()[0] - self.maxEntries
+            if excess > 0:
+                self._db.execute("DELETE FROM sixs WHERE key IN (SELECT key FROM sixs ORDER BY used LIMIT ?)", (excess,))
+            self._db.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def flush(self):
+        with self._lock:
+            self._write_used()
+            self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+def coefficients(meta, state, outputs):
+    """Per band gain and offset so that surface reflectance = TOA * gain + offset.
+
+    outputs maps band -> (Edir, Edif, Lp, tau2). Only depends on its arguments,
+    so scenes can be corrected in any order.
+    """
+    date = scene_date(meta)
+    solar_z = meta['MEAN_SOLAR_ZENITH_ANGLE']
+
+    # Earth-Sun distance (from day of year)
+    doy = date.timetuple().tm_yday
+    d = 1 - 0.01672 * math.cos(0.9856 * (doy - 4))  # http://physics.stackexchange.com/questions/177949/earth-sun-distance-on-a-given-day-of-the-year
+    solar_angle_correction = math.cos(math.radians(solar_z))
+
+    gain = []
+    offset = []
+    for band in S2_BANDS:
+        Edir, Edif, Lp, tau2 = outputs[band]
+
+        # TOA reflectance to at-sensor radiance
+        ESUN = meta['SOLAR_IRRADIANCE_' + band]
+        multiplier = ESUN * solar_angle_correction / (math.pi * d ** 2)
+
+        # radiance to surface reflectance
+        denominator = tau2 * (Edir + Edif)
+        gain.append(multiplier * math.pi / denominator)
+        offset.append(-Lp * math.pi / denominator)
+
+    return {'gain': gain, 'offset': offset}
+
+
+def emulate(pending, states, emulator, done):
+    """Coefficients for all pending scenes from one vectorized emulator lookup."""
+    ids = list(pending)
+    points = [[pending[sceneId]['MEAN_SOLAR_ZENITH_ANGLE'], states[sceneId]['h2o'], states[sceneId]['o3'],
+               states[sceneId]['aot'], states[sceneId]['km']] for sceneId in ids]
+    doys = [scene_date(pending[sceneId]).timetuple().tm_yday for sceneId in ids]
+    out = emulator.outputs(points, doys)
+
+    for n, sceneId in enumerate(ids):
+        outputs = dict((band, tuple(float(v) for v in out[n, b])) for b, band in enumerate(emulator.bands))
+        done[sceneId] = coefficients(pending[sceneId], states[sceneId], outputs)
+    return done
+
+
+def compute(collectionMeta, done=None, workers=4, retries=2, cache=None, emulator=None):
+    """Coefficients for every scene of collectionMeta (system:index -> properties).
+
+    Scenes already in done are skipped. With an emulator (sixs_emulator.Emulator)
+    the outputs are interpolated for all scenes at once. Otherwise the 6S runs
+    still needed are looked up in cache first; the remaining unique runs go to
+    a process pool and failed runs are retried on their own. Returns the
+    updated done dict.
+    """
+    done = {} if done is None else done
+    pending = dict((sceneId, meta) for sceneId, meta in collectionMeta.items() if sceneId not in done)
+    if not pending:
+        return done
+
+    states = conditions(pending)
+
+    if emulator is not None:
+        return emulate(pending, states, emulator, done)
+
+    keys = {}
+    for sceneId, meta in pending.items():
+        date = scene_date(meta)
+        keys[sceneId] = dict((band, quantize(band, meta['MEAN_SOLAR_ZENITH_ANGLE'], states[sceneId], date))
+                             for band in S2_BANDS)
+
+    results = {}
+    for key in set(k for bands in keys.values() for k in bands.values()):
+        outputs = cache.get(key) if cache else None
+        if outputs is not None:
+            results[key] = outputs
+
+    runs = set(k for bands in keys.values() for k in bands.values()) - set(results)
+    attempt = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while runs and attempt <= retries:
+            futures = dict((pool.submit(run_6s, key), key) for key in runs)
+            failed = set()
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                    if cache:
+                        cache.put(key, results[key])
+                except Exception as e:
+                    print("6S failed for " + str(key) + ": " + str(e))
+                    failed.add(key)
+            runs = failed
+            attempt += 1
+
+    if runs:
+        raise RuntimeError("6S failed for " + ", ".join(str(key) for key in sorted(runs)))
+
+    for sceneId, meta in pending.items():
+        outputs = dict((band, results[key]) for band, key in keys[sceneId].items())
+        done[sceneId] = coefficients(meta, states[sceneId], outputs)
+
+    return done
+
+
+def correct(image, table):
+    """Apply the coefficients stored in table (an ee.Dictionary keyed by system:index)."""
+    c = ee.Dictionary(table.get(image.get('system:index')))
+    gain = ee.Image.constant(ee.List(c.get('gain')))
+    offset = ee.Image.constant(ee.List(c.get('offset')))
+    return image.select(S2_BANDS).multiply(gain).add(offset).rename(S2_BANDS)
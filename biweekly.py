@@ -0,0 +1,137 @@
+# biweekly helpers
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+import regions
+
+ORIGIN = datetime.datetime(2014, 1, 1)
+PERIOD_DAYS = 14
+
+# Earth Engine only runs a handful of tasks per user at once; anything above
+# that just sits in the READY queue, so keep a bounded number in flight.
+MAX_CONCURRENT_TASKS = 10
+ACTIVE_STATES = ['UNSUBMITTED', 'READY', 'RUNNING']
+
+# export region coordinates per region and geometry, fetched once and kept on disk
+REGION_CACHE = "export_regions.json"
+_regions = {}
+_regionLock = threading.Lock()
+
+
+def period(week, origin=ORIGIN):
+    """Client-side description of biweek number `week` (1 based)."""
+    startDay = (week - 1) * PERIOD_DAYS
+    endDay = week * PERIOD_DAYS - 1
+    return {'week': week,
+            'startDay': startDay,
+            'endDay': endDay,
+            'startDate': origin + datetime.timedelta(days=startDay),
+            'endDate': origin + datetime.timedelta(days=endDay)}
+
+
+def day_of_year(date):
+    """Zero based day of the year, as ee.Date.getRelative('day', 'year')."""
+    return date.timetuple().tm_yday - 1
+
+
+def export_name(name, regionName, startDate, endDate, week=None):
+    """Asset name of an export: name, region, biweek, year and start and end day of year.
+
+    Built from the python dates of the period, so naming an export needs no
+    getInfo calls.
+    """
+    prefix = name + regionName.replace(" ", "_") + "_"
+    if week is not None:
+        prefix += str(week).zfill(3) + "_"
+    return prefix + str(startDate.year) + str(day_of_year(startDate)).zfill(3) + str(day_of_year(endDate)).zfill(3)
+
+
+def export_region(regionName, geometry, path=REGION_CACHE):
+    """Coordinates of the bounds of geometry, to pass as the region of an export.
+
+    Geometries that are the bounds of a region in the region store come from
+    there. Others are fetched once per region name and geometry, keyed by a
+    hash of the serialized geometry, and stored in a JSON file at path, so
+    every later export of the same geometry, in this run or the next, reuses
+    them.
+    """
+    serialized = ee.serializer.toJSON(geometry)
+    if regions.known(regionName) and serialized == ee.serializer.toJSON(regions.bounds(regionName)):
+        return regions.bounds_coordinates(regionName)
+    key = regionName + "_" + hashlib.md5(serialized.encode('utf-8')).hexdigest()
+    with _regionLock:
+        if not _regions and os.path.exists(path):
+            with open(path) as f:
+                _regions.update(json.load(f))
+        if key not in _regions:
+            _regions[key] = geometry.bounds().getInfo()['coordinates']
+            with open(path, 'w') as f:
+                json.dump(_regions, f, indent=1, sort_keys=True)
+        return _regions[key]
+
+
+def plan(firstWeek, lastWeek, origin=ORIGIN):
+    """All biweeks from firstWeek up to and including lastWeek."""
+    return [period(week, origin) for week in range(firstWeek, lastWeek + 1)]
+
+
+class TaskQueue(object):
+    """Starts export tasks while keeping at most maxTasks active on the account.
+
+    Active tasks are counted from one ee.data.getTaskList() per poll, so
+    exports started elsewhere (TDOM and terrain stores, other processes)
+    count against the limit too.
+    """
+
+    def __init__(self, maxTasks=MAX_CONCURRENT_TASKS, pollInterval=30):
+        self.maxTasks = maxTasks
+        self.pollInterval = pollInterval
+        self.active = []
+        self.submitted = []
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Number of active tasks on the account."""
+        states = dict((task['id'], task['state']) for task in ee.data.getTaskList())
+        # a task started a moment ago may not be listed yet
+        self.active = [task for task in self.active if states.get(task.id, 'READY') in ACTIVE_STATES]
+        ours = set(task.id for task in self.active)
+        return len(ours) + len([id for id, state in states.items() if state in ACTIVE_STATES and id not in ours])
+
+    def submit(self, task):
+        # the lock only guards the check and start; waiting for a free slot
+        # happens outside it so other submitters keep polling too
+        while True:
+            with self._lock:
+                if self._refresh() < self.maxTasks:
+                    task.start()
+                    self.active.append(task)
+                    self.submitted.append(task)
+                    return task
+            time.sleep(self.pollInterval)
+
+    def wait(self):
+        """Block until every submitted task has left the active states."""
+        while True:
+            with self._lock:
+                self._refresh()
+                if not self.active:
+                    return
+            time.sleep(self.pollInterval)
+
+
+def run(build, periods, workers=8):
+    """Call build(period) for every period on a thread pool.
+
+    build is expected to construct the graph for one period and hand its export
+    task to a shared TaskQueue; results are returned in period order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(build, periods))
@@ -0,0 +1,41 @@
+# BRDF correction helpers
+
+import ee
+
+# (band, f_iso, f_geo, f_vol)
+LANDSAT_COEFFICIENTS = [
+    ('blue', 0.0774, 0.0079, 0.0372),
+    ('green', 0.1306, 0.0178, 0.0580),
+    ('red', 0.1690, 0.0227, 0.0574),
+    ('nir', 0.3093, 0.0330, 0.1535),
+    ('swir1', 0.3430, 0.0453, 0.1154),
+    ('swir2', 0.2658, 0.0387, 0.0639)]
+
+S2_COEFFICIENTS = [
+    ('blue', 0.0774, 0.0079, 0.0372),
+    ('green', 0.1306, 0.0178, 0.0580),
+    ('red', 0.1690, 0.0227, 0.0574),
+    ('re1', 0.2085, 0.0256, 0.0845),
+    ('re2', 0.2316, 0.0273, 0.1003),
+    ('re3', 0.2599, 0.0294, 0.1197),
+    ('nir', 0.3093, 0.0330, 0.1535),
+    ('re4', 0.2907, 0.0410, 0.1611),
+    ('swir1', 0.3430, 0.0453, 0.1154),
+    ('swir2', 0.2658, 0.0387, 0.0639)]
+
+
+def apply(image, kvol, kvol0, coefficients):
+    """Correct every band of the coefficient table in one multi-band expression.
+
+    For each band pred = fiso + (fvol + fgeo) * kvol, pred0 the same with
+    kvol0, and the band is multiplied by pred0 / pred. kvol and kvol0 are
+    single band images and are broadcast over the bands.
+    """
+    bands = [c[0] for c in coefficients]
+    iso = ee.Image.constant([c[1] for c in coefficients])
+    volgeo = ee.Image.constant([c[3] + c[2] for c in coefficients])
+
+    pred = volgeo.multiply(kvol).add(iso)
+    pred0 = volgeo.multiply(kvol0).add(iso)
+    corr = image.select(bands).multiply(pred0.divide(pred)).rename(bands)
+    return image.addBands(corr, None, True)
@@ -8,6 +8,12 @@ import os, sys
 from utils import *
 import sun_angles
 import view_angles
+import tdom
+import topography
+import brdf_correction
+import medoids
+import biweekly
+import regions
 import time
 
 class env(object):
@@ -18,7 +24,8 @@ class env(object):
 		# Initialize the Earth Engine object, using the authentication credentials.
 		ee.Initialize()
 		
-		self.dem = ee.Image("JAXA/ALOS/AW3D30_V1_1").select(["AVE"])
+		self.dem = ee.Image("USGS/SRTMGL1_003")
+		self.demName = "SRTM"
 		self.epsg = "EPSG:32717"
 				
 		##########################################
@@ -58,6 +65,15 @@ class env(object):
 		self.dilatePixels = 3.25;	
 		
 		
+		##########################################
+		# variable for the TDOM statistics       #
+		##########################################
+		
+		# the per-pixel mean/stdDev used by TDOM are stored as assets per sensor,
+		# region and epoch; change tdomEpoch to recompute them for a grown archive
+		self.tdomAssetRoot = "projects/Sacha/AncillaryData/TDOM/"
+		self.tdomEpoch = "2019"
+		
 		##########################################
 		# variable for cloudScore  algorithm     #
 		##########################################	
@@ -80,6 +96,18 @@ class env(object):
 		
 		self.terrainScale = 600
 		
+		# slope, aspect and their trigonometry are stored per DEM, region and
+		# projection at the native DEM resolution
+		self.terrainAssetRoot = "projects/Sacha/AncillaryData/Terrain/"
+		self.demScale = 30
+		
+		##########################################
+		# variable for brdf correction           #
+		##########################################		
+		
+		# zenithMethod of view_angles.create
+		self.viewZenithMethod = 'distance'
+
 		##########################################
 		# variable band selection  		         #
 		##########################################		
@@ -111,9 +139,11 @@ class functions():
 	
 	def main(self,studyArea,startDate,endDate,startDay,endDay,week,regionName):
 		
-		self.env.startDate = startDate
-		self.env.endDate = endDate
-
+		self.env.startDate = ee.Date(startDate)
+		self.env.endDate = ee.Date(endDate)
+		
+		# python dates, to name the export without getInfo calls
+		self.env.exportDates = [startDate,endDate]
 
 		self.env.startDoy = startDay
 		self.env.endDoy = endDay
@@ -172,6 +202,8 @@ class functions():
 
 						
 			if self.env.terrainCorrection == True:
+				self.terrainLayers = topography.derivatives(self.env.dem,self.env.demName,self.studyArea,self.regionName, \
+															self.env.terrainAssetRoot,self.env.epsg,self.env.demScale)
 				landsat = ee.ImageCollection(landsat.map(self.terrain))
 
 			
@@ -195,9 +227,9 @@ class functions():
 		day = date.getRelative('day','year').add(1);
 		yr = date.get('year');
 		mk = img.mask().reduce(ee.Reducer.min());
-	  	
-	  	img = img.addBands(ee.Image.constant(day).mask(mk).uint16().rename('date'));
-	  	img = img.addBands(ee.Image.constant(yr).mask(mk).uint16().rename('year'));
+		
+		img = img.addBands(ee.Image.constant(day).mask(mk).uint16().rename('date'));
+		img = img.addBands(ee.Image.constant(yr).mask(mk).uint16().rename('year'));
 		
 		return img;
 	
@@ -289,8 +321,8 @@ class functions():
 		shadowSumBands = ['nir','swir1']
 
 		# Get some pixel-wise stats for the time series
-		irStdDev = self.fullCollection.select(shadowSumBands).reduce(ee.Reducer.stdDev())
-		irMean = self.fullCollection.select(shadowSumBands).reduce(ee.Reducer.mean())
+		irMean, irStdDev = tdom.statistics(self.fullCollection,shadowSumBands,'L8',self.studyArea,self.regionName,self.env.tdomEpoch, \
+										   self.env.tdomAssetRoot,self.env.epsg,self.env.exportScale)
 
 		# Mask out dark dark outliers
 		collection_tdom = collection.map(TDOM)
@@ -306,7 +338,6 @@ class functions():
 
 		def topoCorr_IC(img):
 			
-			dem = ee.Image("USGS/SRTMGL1_003")
 			
 			
 			# Extract image metadata about solar position
@@ -314,24 +345,24 @@ class functions():
 			SA_rad = ee.Image.constant(ee.Number(img.get('SOLAR_AZIMUTH_ANGLE'))).multiply(degree2radian).clip(img.geometry().buffer(10000)); 
 			
 				
-			# Creat terrain layers
-			slp = ee.Terrain.slope(dem).clip(img.geometry().buffer(10000));
-			slp_rad = ee.Terrain.slope(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
-			asp_rad = ee.Terrain.aspect(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
+			# terrain layers
+			layers = self.terrainLayers.clip(img.geometry().buffer(10000))
+			slp = layers.select('slope');
+			asp_rad = layers.select('aspect_rad');
   
   
 			
 			# Calculate the Illumination Condition (IC)
 			# slope part of the illumination condition
 			cosZ = SZ_rad.cos();
-			cosS = slp_rad.cos();
+			cosS = layers.select('cosS');
 			slope_illumination = cosS.expression("cosZ * cosS", \
-												{'cosZ': cosZ, 'cosS': cosS.select('slope')});
+												{'cosZ': cosZ, 'cosS': cosS});
 			
 			
 			# aspect part of the illumination condition
 			sinZ = SZ_rad.sin(); 
-			sinS = slp_rad.sin();
+			sinS = layers.select('sinS');
 			cosAziDiff = (SA_rad.subtract(asp_rad)).cos();
 			aspect_illumination = sinZ.expression("sinZ * sinS * cosAziDiff", \
                                            {'sinZ': sinZ, \
@@ -360,56 +391,14 @@ class functions():
 			bandList = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']; # Specify Bands to topographically correct
 
 
-			def applyBands(image):
-				blue = apply_SCSccorr('blue').select(['blue'])
-				green = apply_SCSccorr('green').select(['green'])
-				red = apply_SCSccorr('red').select(['red'])
-				nir = apply_SCSccorr('nir').select(['nir'])
-				swir1 = apply_SCSccorr('swir1').select(['swir1'])
-				swir2 = apply_SCSccorr('swir2').select(['swir2'])
-				return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-			def apply_SCSccorr(band):
-				method = 'SCSc';
-						
-				out = ee.Image(1).addBands(img_plus_ic_mask2.select('IC', band)).reduceRegion(reducer= ee.Reducer.linearRegression(2,1), \
-  																	   geometry= ee.Geometry(img.geometry().buffer(-5000)), \
-																		scale= self.env.terrainScale, \
-																		bestEffort =True,
-																		maxPixels=1e10)
-																		
-				
-				#out_a = ee.Number(out.get('scale'));
-				#out_b = ee.Number(out.get('offset'));
-				#out_c = ee.Number(out.get('offset')).divide(ee.Number(out.get('scale')));
-				
-				
-				fit = out.combine({"coefficients": ee.Array([[1],[1]])}, False);
-
-				#Get the coefficients as a nested list, 
-				#cast it to an array, and get just the selected column
-				out_a = (ee.Array(fit.get('coefficients')).get([0,0]));
-				out_b = (ee.Array(fit.get('coefficients')).get([1,0]));
-				out_c = out_a.divide(out_b)
-
-					
-				# apply the SCSc correction
-				SCSc_output = img_plus_ic_mask2.expression("((image * (cosB * cosZ + cvalue)) / (ic + cvalue))", {
-																'image': img_plus_ic_mask2.select([band]),
-																'ic': img_plus_ic_mask2.select('IC'),
-																'cosB': img_plus_ic_mask2.select('cosS'),
-																'cosZ': img_plus_ic_mask2.select('cosZ'),
-																'cvalue': out_c });
-		  
-				return ee.Image(SCSc_output);
-																	  
-			#img_SCSccorr = ee.Image([apply_SCSccorr(band) for band in bandList]).addBands(img_plus_ic.select('IC'));
-			img_SCSccorr = applyBands(img).select(bandList).addBands(img_plus_ic.select('IC'))
+			# one regression for all bands
+			img_SCSccorr = topography.scsc(img_plus_ic_mask2, bandList, ee.Geometry(img.geometry().buffer(-5000)), self.env.terrainScale) \
+										 .addBands(img_plus_ic.select('IC'))
 		
 			bandList_IC = ee.List([bandList, 'IC']).flatten();
 			
 			img_SCSccorr = img_SCSccorr.unmask(img_plus_ic.select(bandList_IC)).select(bandList);
-  			
+			
 			return img_SCSccorr.unmask(img_plus_ic.select(bandList)) 
 	
 		
@@ -476,34 +465,12 @@ class functions():
 
 
 
- 	def brdf(self,img):   
+	def brdf(self,img):   
 		
 		import sun_angles
 		import view_angles
 
 	
-		def _apply(image, kvol, kvol0):
-			blue = _correct_band(image, 'blue', kvol, kvol0, f_iso=0.0774, f_geo=0.0079, f_vol=0.0372)
-			green = _correct_band(image, 'green', kvol, kvol0, f_iso=0.1306, f_geo=0.0178, f_vol=0.0580)
-			red = _correct_band(image, 'red', kvol, kvol0, f_iso=0.1690, f_geo=0.0227, f_vol=0.0574)
-			nir = _correct_band(image, 'nir', kvol, kvol0, f_iso=0.3093, f_geo=0.0330, f_vol=0.1535)
-			swir1 = _correct_band(image, 'swir1', kvol, kvol0, f_iso=0.3430, f_geo=0.0453, f_vol=0.1154)
-			swir2 = _correct_band(image, 'swir2', kvol, kvol0, f_iso=0.2658, f_geo=0.0387, f_vol=0.0639)
-			return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-
-		def _correct_band(image, band_name, kvol, kvol0, f_iso, f_geo, f_vol):
-			"""fiso + fvol * kvol + fgeo * kgeo"""
-			iso = ee.Image(f_iso)
-			geo = ee.Image(f_geo)
-			vol = ee.Image(f_vol)
-			pred = vol.multiply(kvol).add(geo.multiply(kvol)).add(iso).rename(['pred'])
-			pred0 = vol.multiply(kvol0).add(geo.multiply(kvol0)).add(iso).rename(['pred0'])
-			cfac = pred0.divide(pred).rename(['cfac'])
-			corr = image.select(band_name).multiply(cfac).rename([band_name])
-			return corr
-
-
 		def _kvol(sunAz, sunZen, viewAz, viewZen):
 			"""Calculate kvol kernel.
 			From Lucht et al. 2000
@@ -543,14 +510,14 @@ class functions():
 
 			return (kvol, kvol0)
          
- 		date = img.date()
+		date = img.date()
 		footprint = determine_footprint(img)
 		(sunAz, sunZen) = sun_angles.create(date, footprint)
-		(viewAz, viewZen) = view_angles.create(footprint)
+		(viewAz, viewZen) = view_angles.create(footprint, self.env.viewZenithMethod)
 		(kvol, kvol0) = _kvol(sunAz, sunZen, viewAz, viewZen)
-		return _apply(img, kvol.multiply(PI()), kvol0.multiply(PI()))
+		return brdf_correction.apply(img, kvol.multiply(PI()), kvol0.multiply(PI()), brdf_correction.LANDSAT_COEFFICIENTS)
 
- 			
+			
 	def medoidMosaic(self,collection):
 		""" medoid composite with equal weight among indices """
 		nImages = ee.ImageCollection(collection).select([0]).count().rename('count')
@@ -559,19 +526,7 @@ class functions():
 
 		others = collection.select(otherBands).reduce(ee.Reducer.mean()).rename(otherBands);
 		
-		collection = collection.select(self.env.divideBands)
-
-		bandNumbers = ee.List.sequence(1,self.env.divideBands.length());
-
-		median = ee.ImageCollection(collection).median()
-        
-		def subtractmedian(img):
-			diff = ee.Image(img).subtract(median).pow(ee.Image.constant(2));
-			return diff.reduce('sum').addBands(img);
-        
-		medoid = collection.map(subtractmedian)
-  
-		medoid = ee.ImageCollection(medoid).reduce(ee.Reducer.min(self.env.divideBands.length().add(1))).select(bandNumbers,self.env.divideBands);
+		medoid = medoids.mosaic(collection,self.env.divideBands)
   
 		return medoid.addBands(others).addBands(nImages);		
 
@@ -614,22 +569,18 @@ class functions():
 
 	def exportMap(self,img,studyArea,week):
 
-		geom  = studyArea.getInfo();
-		sd = str(self.env.startDate.getRelative('day','year').getInfo()).zfill(3);
-		ed = str(self.env.endDate.getRelative('day','year').getInfo()).zfill(3);
-		year = str(self.env.startDate.get('year').getInfo());
-		regionName = self.regionName.replace(" ",'_') + "_"
+		name = biweekly.export_name(self.env.name,self.regionName,self.env.exportDates[0],self.env.exportDates[1],week)
 
 		task_ordered= ee.batch.Export.image.toAsset(image=img, 
-								  description = self.env.name + regionName + str(week).zfill(3) +'_'+ year + sd + ed, 
-								  assetId= self.env.assetId + self.env.name + regionName + str(week).zfill(3)+'_'+ year + sd + ed,
-								  region=geom['coordinates'], 
+								  description = name, 
+								  assetId= self.env.assetId + name,
+								  region=biweekly.export_region(self.regionName,studyArea), 
 								  maxPixels=1e13,
 								  crs=self.env.epsg,
 								  scale=self.env.exportScale)
 	
 		task_ordered.start()
-		print(self.env.assetId + self.env.name + regionName + str(week).zfill(3)+'_'+ year + sd + ed)
+		print(self.env.assetId + name)
 
 
 
@@ -642,18 +593,17 @@ if __name__ == "__main__":
 	for i in range(0,105,1):
 		#2018 starts at week 104
 		startWeek = start+ i
-		print startWeek
+		print(startWeek)
 	
-		year = ee.Date("2014-01-01")
-		startDay = (startWeek -1) *14
-		endDay = (startWeek) *14 -1
+		period = biweekly.period(startWeek)
+		startDay = period['startDay']
+		endDay = period['endDay']
 
-		startDate = year.advance(startDay,"day") 
-		endDate = year.advance(endDay,"day") 
+		startDate = period['startDate']
+		endDate = period['endDate']
 
 		regionName = 'AMAZONIA NOROCCIDENTAL'
-		studyArea =  ee.FeatureCollection("projects/Sacha/AncillaryData/StudyRegions/Ecuador_EcoRegions_Complete")
-		studyArea = studyArea.filterMetadata('PROVINCIA','equals',regionName).geometry().bounds()
+		studyArea = regions.bounds(regionName)
 		
 		print(functions().main(studyArea,startDate,endDate,startDay,endDay,startWeek,regionName))
 
@@ -8,6 +8,11 @@ import os, sys
 from utils import *
 import sun_angles
 import view_angles
+import tdom
+import topography
+import brdf_correction
+import medoids
+import biweekly
 import time
 
 class env(object):
@@ -19,6 +24,7 @@ class env(object):
 		ee.Initialize()
 		
 		self.dem = ee.Image("USGS/SRTMGL1_003")
+		self.demName = "SRTM"
 		self.epsg = "EPSG:32717"
 				
 		##########################################
@@ -34,6 +40,9 @@ class env(object):
 		self.name = "landsat_SR_Biweek_" 
 		self.exportScale = 30		
 		
+		# the study area covers all of Ecuador; used to name the TDOM statistics
+		self.regionName = "Ecuador"
+		
 		##########################################
 		# variable for the shadowMask  algorithm #
 		##########################################
@@ -58,6 +67,15 @@ class env(object):
 		self.dilatePixels = 2.5;	
 		
 		
+		##########################################
+		# variable for the TDOM statistics       #
+		##########################################
+		
+		# the per-pixel mean/stdDev used by TDOM are stored as assets per sensor,
+		# region and epoch; change tdomEpoch to recompute them for a grown archive
+		self.tdomAssetRoot = "projects/Sacha/AncillaryData/TDOM/"
+		self.tdomEpoch = "2019"
+		
 		##########################################
 		# variable for cloudScore  algorithm     #
 		##########################################	
@@ -80,6 +98,18 @@ class env(object):
 		
 		self.terrainScale = 300
 		
+		# slope, aspect and their trigonometry are stored per DEM, region and
+		# projection at the native DEM resolution
+		self.terrainAssetRoot = "projects/Sacha/AncillaryData/Terrain/"
+		self.demScale = 30
+		
+		##########################################
+		# variable for brdf correction           #
+		##########################################		
+		
+		# zenithMethod of view_angles.create
+		self.viewZenithMethod = 'distance'
+
 		##########################################
 		# variable band selection  		         #
 		##########################################		
@@ -108,8 +138,8 @@ class functions():
 	
 	def main(self,studyArea,startDate,endDate,startDay,endDay,week):
 		
-		self.env.startDate = startDate
-		self.env.endDate = endDate
+		self.env.startDate = ee.Date(startDate)
+		self.env.endDate = ee.Date(endDate)
 		
 		self.env.startDoy = startDay
 		self.env.endDoy = endDay
@@ -151,6 +181,8 @@ class functions():
 						
 			if self.env.terrainCorrection == True:
 				print("terrain correction")
+				self.terrainLayers = topography.derivatives(self.env.dem,self.env.demName,studyArea.geometry(),self.env.regionName, \
+															self.env.terrainAssetRoot,self.env.epsg,self.env.demScale)
 				landsat8 = ee.ImageCollection(landsat8.map(self.terrain))
 			
 			print("calculating medoid")
@@ -253,8 +285,8 @@ class functions():
 		self.fullCollection = ee.ImageCollection('LANDSAT/LC08/C01/T1_SR').filterBounds(studyArea).select(self.env.sensorBandDictLandsatSR.get('L8'),self.env.bandNamesLandsat)  
 
 		# Get some pixel-wise stats for the time series
-		irStdDev = self.fullCollection.select(shadowSumBands).reduce(ee.Reducer.stdDev())
-		irMean = self.fullCollection.select(shadowSumBands).reduce(ee.Reducer.mean())
+		irMean, irStdDev = tdom.statistics(self.fullCollection,shadowSumBands,'L8',studyArea.geometry(),self.env.regionName,self.env.tdomEpoch, \
+										   self.env.tdomAssetRoot,self.env.epsg,self.env.exportScale)
 
 		# Mask out dark dark outliers
 		collection_tdom = collection.map(TDOM)
@@ -269,7 +301,6 @@ class functions():
  
 		def topoCorr_IC(img):
 			
-			dem = ee.Image("USGS/SRTMGL1_003")
 			
 			
 			# Extract image metadata about solar position
@@ -277,24 +308,24 @@ class functions():
 			SA_rad = ee.Image.constant(ee.Number(img.get('SOLAR_AZIMUTH_ANGLE'))).multiply(degree2radian).clip(img.geometry().buffer(10000)); 
 			
 				
-			# Creat terrain layers
-			slp = ee.Terrain.slope(dem).clip(img.geometry().buffer(10000));
-			slp_rad = ee.Terrain.slope(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
-			asp_rad = ee.Terrain.aspect(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
+			# terrain layers
+			layers = self.terrainLayers.clip(img.geometry().buffer(10000))
+			slp = layers.select('slope');
+			asp_rad = layers.select('aspect_rad');
   
   
 			
 			# Calculate the Illumination Condition (IC)
 			# slope part of the illumination condition
 			cosZ = SZ_rad.cos();
-			cosS = slp_rad.cos();
+			cosS = layers.select('cosS');
 			slope_illumination = cosS.expression("cosZ * cosS", \
-												{'cosZ': cosZ, 'cosS': cosS.select('slope')});
+												{'cosZ': cosZ, 'cosS': cosS});
 			
 			
 			# aspect part of the illumination condition
 			sinZ = SZ_rad.sin(); 
-			sinS = slp_rad.sin();
+			sinS = layers.select('sinS');
 			cosAziDiff = (SA_rad.subtract(asp_rad)).cos();
 			aspect_illumination = sinZ.expression("sinZ * sinS * cosAziDiff", \
                                            {'sinZ': sinZ, \
@@ -323,39 +354,9 @@ class functions():
 			bandList = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']; # Specify Bands to topographically correct
     
 
-			def applyBands(image):
-				blue = apply_SCSccorr('blue').select(['blue'])
-				green = apply_SCSccorr('green').select(['green'])
-				red = apply_SCSccorr('red').select(['red'])
-				nir = apply_SCSccorr('nir').select(['nir'])
-				swir1 = apply_SCSccorr('swir1').select(['swir1'])
-				swir2 = apply_SCSccorr('swir2').select(['swir2'])
-				return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-			def apply_SCSccorr(band):
-				method = 'SCSc';
-		
-				out = img_plus_ic_mask2.select('IC', band).reduceRegion(reducer= ee.Reducer.linearFit(), \
-																		geometry= ee.Geometry(img.geometry().buffer(-5000)), \
-																		scale= self.env.terrainScale, \
-																		maxPixels = 1e13); 
-
-				out_a = ee.Number(out.get('scale'));
-				out_b = ee.Number(out.get('offset'));
-				out_c = ee.Number(out.get('offset')).divide(ee.Number(out.get('scale')));
-				
-				# apply the SCSc correction
-				SCSc_output = img_plus_ic_mask2.expression("((image * (cosB * cosZ + cvalue)) / (ic + cvalue))", {
-															'image': img_plus_ic_mask2.select([band]),
-															'ic': img_plus_ic_mask2.select('IC'),
-															'cosB': img_plus_ic_mask2.select('cosS'),
-															'cosZ': img_plus_ic_mask2.select('cosZ'),
-															'cvalue': out_c });
-      
-				return ee.Image(SCSc_output);
-																  
-			#img_SCSccorr = ee.Image([apply_SCSccorr(band) for band in bandList]).addBands(img_plus_ic.select('IC'));
-			img_SCSccorr = applyBands(img).select(bandList).addBands(img_plus_ic.select('IC'))
+			# one regression for all bands
+			img_SCSccorr = topography.scsc(img_plus_ic_mask2, bandList, ee.Geometry(img.geometry().buffer(-5000)), self.env.terrainScale, 1e13) \
+										 .addBands(img_plus_ic.select('IC'))
 		
 			bandList_IC = ee.List([bandList, 'IC']).flatten();
 			
@@ -377,28 +378,6 @@ class functions():
 		import view_angles
 
 	
-		def _apply(image, kvol, kvol0):
-			blue = _correct_band(image, 'blue', kvol, kvol0, f_iso=0.0774, f_geo=0.0079, f_vol=0.0372)
-			green = _correct_band(image, 'green', kvol, kvol0, f_iso=0.1306, f_geo=0.0178, f_vol=0.0580)
-			red = _correct_band(image, 'red', kvol, kvol0, f_iso=0.1690, f_geo=0.0227, f_vol=0.0574)
-			nir = _correct_band(image, 'nir', kvol, kvol0, f_iso=0.3093, f_geo=0.0330, f_vol=0.1535)
-			swir1 = _correct_band(image, 'swir1', kvol, kvol0, f_iso=0.3430, f_geo=0.0453, f_vol=0.1154)
-			swir2 = _correct_band(image, 'swir2', kvol, kvol0, f_iso=0.2658, f_geo=0.0387, f_vol=0.0639)
-			return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-
-		def _correct_band(image, band_name, kvol, kvol0, f_iso, f_geo, f_vol):
-			"""fiso + fvol * kvol + fgeo * kgeo"""
-			iso = ee.Image(f_iso)
-			geo = ee.Image(f_geo)
-			vol = ee.Image(f_vol)
-			pred = vol.multiply(kvol).add(geo.multiply(kvol)).add(iso).rename(['pred'])
-			pred0 = vol.multiply(kvol0).add(geo.multiply(kvol0)).add(iso).rename(['pred0'])
-			cfac = pred0.divide(pred).rename(['cfac'])
-			corr = image.select(band_name).multiply(cfac).rename([band_name])
-			return corr
-
-
 		def _kvol(sunAz, sunZen, viewAz, viewZen):
 			"""Calculate kvol kernel.
 			From Lucht et al. 2000
@@ -441,9 +420,9 @@ class functions():
 		date = img.date()
 		footprint = determine_footprint(img)
 		(sunAz, sunZen) = sun_angles.create(date, footprint)
-		(viewAz, viewZen) = view_angles.create(footprint)
+		(viewAz, viewZen) = view_angles.create(footprint, self.env.viewZenithMethod)
 		(kvol, kvol0) = _kvol(sunAz, sunZen, viewAz, viewZen)
-		return _apply(img, kvol.multiply(PI()), kvol0.multiply(PI()))
+		return brdf_correction.apply(img, kvol.multiply(PI()), kvol0.multiply(PI()), brdf_correction.LANDSAT_COEFFICIENTS)
 
  			
 	def medoidMosaic(self,collection):
@@ -454,19 +433,7 @@ class functions():
 
 		others = collection.select(otherBands).reduce(ee.Reducer.mean()).rename(otherBands);
 		
-		collection = collection.select(self.env.divideBands)
-
-		bandNumbers = ee.List.sequence(1,self.env.divideBands.length());
-
-		median = ee.ImageCollection(collection).median()
-        
-		def subtractmedian(img):
-			diff = ee.Image(img).subtract(median).pow(ee.Image.constant(2));
-			return diff.reduce('sum').addBands(img);
-        
-		medoid = collection.map(subtractmedian)
-  
-		medoid = ee.ImageCollection(medoid).reduce(ee.Reducer.min(self.env.divideBands.length().add(1))).select(bandNumbers,self.env.divideBands);
+		medoid = medoids.mosaic(collection,self.env.divideBands)
   
 		return medoid.addBands(others);		
 
@@ -504,12 +471,10 @@ class functions():
 
 	def exportMap(self,img,studyArea,week):
 
-		geom  = studyArea.geometry().bounds().getInfo();
-		
 		task_ordered= ee.batch.Export.image.toAsset(image=img.clip(studyArea), 
 								  description = self.env.name + str(week), 
 								  assetId= self.env.assetId + self.env.name + str(week).zfill(3),
-								  region=geom['coordinates'], 
+								  region=biweekly.export_region(self.env.regionName,studyArea.geometry()), 
 								  maxPixels=1e13,
 								  crs=self.env.epsg,
 								  scale=self.env.exportScale)
@@ -526,32 +491,32 @@ if __name__ == "__main__":
 
 
 	# 2015
-	year = ee.Date("2016-01-01")
+	year = datetime.datetime(2016,1,1)
 	startWeek = 39
 	startDay = [168,182,196,210,224,238,252,266,280,294,308,322,336,350,364]
 	endDay =   [181,195,209,223,237,251,265,279,293,307,321,335,349,363,377]
 
 	# 2016
-	year = ee.Date("2016-01-01")
+	year = datetime.datetime(2016,1,1)
 	startWeek = 54
 	startDay = [13,27,41,55,69,83,97,111,125,139,153,167,181,195,209,223,237,251,265,279,293,307,321,335,349,363]
 	endDay = [26,40,54,68,82,96,110,124,138,152,166,180,194,208,222,236,250,264,278,292,306,320,334,348,362,376]
 
  	# 2017
-	year = ee.Date("2017-01-01")
+	year = datetime.datetime(2017,1,1)
 	startWeek = 80
 	startDay = [11,25,39,53,67,81,95,109,123,137,151,165,179,193,207,221,235,249,263,277,291,305,319,333,347,361]
 	endDay = [24,38,52,66,80,94,108,122,136,150,164,178,192,206,220,234,248,262,276,290,304,318,332,346,360,374]
 
 	# 2018
-	year = ee.Date("2018-01-01")
+	year = datetime.datetime(2018,1,1)
 	startWeek = 106
 	startDay = [10,24,38,52,66,80,94,108,122,136,150,164,178,192,206,220,234,248,262,276,290,304,318,332,346,360]
 	endDay = [23,37,51,65,79,93,107,121,135,149,163,177,191,205,219,233,247,261,275,289,303,317,331,345,359,373]
 	
 	
 	for i in range(2,3,1):
-		startDate = year.advance(startDay[i],"day")
-		endDate = year.advance(endDay[i],"day")
+		startDate = year + datetime.timedelta(days=startDay[i])
+		endDate = year + datetime.timedelta(days=endDay[i])
 		
 		functions().main(studyArea,startDate,endDate,startDay[i],endDay[i],startWeek+i)
@@ -3,7 +3,13 @@
 
 import ee
 import math 
+import datetime
 from utils import *
+import biweekly
+import regions
+import topography
+import brdf_correction
+import medoids
 
 class env(object):
 
@@ -36,6 +42,15 @@ class env(object):
 
         self.terrainScale = 600
         self.dem = ee.Image("JAXA/ALOS/AW3D30_V1_1").select("MED")
+        self.demName = "ALOS_MED"
+
+        # slope, aspect and their trigonometry are stored per DEM, region and
+        # projection at the native DEM resolution
+        self.terrainAssetRoot = "projects/Sacha/AncillaryData/Terrain/"
+        self.demScale = 30
+
+        # zenithMethod of view_angles.create
+        self.viewZenithMethod = 'distance'
 
         self.cloudScoreThresh= 2
         self.cloudScorePctl= 11
@@ -47,6 +62,11 @@ class env(object):
                         
         self.SLC = False
         self.percentiles = [20,80] 
+
+        # statistics added next to the stdDev bands in addSTDdev: 'mean' and/or 'minMax',
+        # and per-pixel percentiles, all computed in the same reduce
+        self.extraStatistics = []
+        self.statisticsPercentiles = []
         
         self.medoidBands = ee.List(['blue','green','red','nir','swir1','swir2'])
         self.divideBands = ee.List(['blue','green','red','nir','swir1','swir2'])
@@ -69,6 +89,9 @@ class functions():
 		self.env.location = aoi
 		self.env.startDate = ee.Date.fromYMD(year,1,1)
 		self.env.endDate = ee.Date.fromYMD(year+1,1,1)
+		
+		# python dates, to name the export without getInfo calls
+		self.env.exportDates = [datetime.datetime(year,1,1),datetime.datetime(year+1,1,1)]
 
 		landsat5 =  ee.ImageCollection('LANDSAT/LT05/C01/T1_SR').filterDate(self.env.startDate,self.env.endDate).filterBounds(self.env.location)
 		landsat5 = landsat5.filterMetadata('CLOUD_COVER','less_than',self.env.metadataCloudCoverMax)
@@ -88,7 +111,7 @@ class functions():
 		else:
 			landsat = landsat5.merge(landsat8)
 		
-		print landsat.size().getInfo()
+		print(landsat.size().getInfo())
 		if landsat.size().getInfo() > 0:
 			
 			# mask clouds using the QA band
@@ -123,12 +146,15 @@ class functions():
 				#print('after brdf',landsat.first().getInfo())
 						
 			if self.env.terrainCorrection == True:
+				self.terrainLayers = topography.derivatives(self.env.dem,self.env.demName,self.env.location,self.env.regionName, \
+															self.env.terrainAssetRoot,self.env.epsg,self.env.demScale)
 				landsat = ee.ImageCollection(landsat.map(self.terrain))
 				#print('after terrain',landsat.first().getInfo())
 			
 			medoid = self.medoidMosaic(landsat)
-			medoidDown = ee.Image(self.medoidMosaicPercentiles(landsat,self.env.percentiles[0]))
-			medoidUp = self.medoidMosaicPercentiles(landsat,self.env.percentiles[1])
+			percentileMedoids = self.percentileMedoids(landsat)
+			medoidDown = ee.Image(self.medoidMosaicPercentiles(percentileMedoids,self.env.percentiles[0]))
+			medoidUp = self.medoidMosaicPercentiles(percentileMedoids,self.env.percentiles[1])
 			stdevBands = self.addSTDdev(landsat)
 			
 			mosaic = medoid.addBands(medoidDown).addBands(medoidUp).addBands(stdevBands)
@@ -148,9 +174,9 @@ class functions():
 		day = date.getRelative('day','year').add(1);
 		yr = date.get('year');
 		mk = img.mask().reduce(ee.Reducer.min());
-	  	
-	  	img = img.addBands(ee.Image.constant(day).mask(mk).uint16().rename('date'));
-	  	img = img.addBands(ee.Image.constant(yr).mask(mk).uint16().rename('year'));
+		
+		img = img.addBands(ee.Image.constant(day).mask(mk).uint16().rename('date'));
+		img = img.addBands(ee.Image.constant(yr).mask(mk).uint16().rename('year'));
 		
 		return img;
 
@@ -276,21 +302,17 @@ class functions():
 		
 		
 		
-		blue_stdDev = collection.select(["blue"]).reduce(ee.Reducer.stdDev()).rename(['blue_stdDev'])
-		red_stdDev = collection.select(["red"]).reduce(ee.Reducer.stdDev()).rename(['red_stdDev'])
-		green_stdDev = collection.select(["green"]).reduce(ee.Reducer.stdDev()).rename(['green_stdDev'])
-		nir_stdDev = collection.select(["nir"]).reduce(ee.Reducer.stdDev()).rename(['nir_stdDev'])
-		swir1_stdDev = collection.select(["swir1"]).reduce(ee.Reducer.stdDev()).rename(['swir1_stdDev'])
-		swir2_stdDev = collection.select(["swir2"]).reduce(ee.Reducer.stdDev()).rename(['swir2_stdDev'])
-		
-		col = collection.map(addSTDdevIndices)
+		# one reducer for every band and index: stdDev plus the optional statistics
+		reducer = ee.Reducer.stdDev()
+		if 'mean' in self.env.extraStatistics:
+			reducer = reducer.combine(ee.Reducer.mean(), '', True)
+		if 'minMax' in self.env.extraStatistics:
+			reducer = reducer.combine(ee.Reducer.minMax(), '', True)
+		if self.env.statisticsPercentiles:
+			reducer = reducer.combine(ee.Reducer.percentile(self.env.statisticsPercentiles), '', True)
 		
-		ND_green_swir1 = col.select(['ND_green_swir1']).reduce(ee.Reducer.stdDev()).rename(['ND_green_swir1_stdDev']);
-		ND_nir_red = col.select(['ND_nir_red']).reduce(ee.Reducer.stdDev()).rename(['ND_nir_red_stdDev']);
-		ND_nir_swir2 = col.select(['ND_nir_swir2']).reduce(ee.Reducer.stdDev()).rename(['ND_nir_swir2_stdDev']);
-		
-		stdevBands = ee.Image(blue_stdDev.addBands(red_stdDev).addBands(green_stdDev).addBands(nir_stdDev).addBands(swir1_stdDev).addBands(swir2_stdDev)\
-								.addBands(ND_green_swir1).addBands(ND_nir_red).addBands(ND_nir_swir2))
+		bands = ['blue','red','green','nir','swir1','swir2','ND_green_swir1','ND_nir_red','ND_nir_swir2']
+		stdevBands = collection.map(addSTDdevIndices).select(bands).reduce(reducer)
 		
 		return stdevBands
 								
@@ -360,7 +382,6 @@ class functions():
  
 		def topoCorr_IC(img):
 			
-			dem = self.env.dem
 			
 			
 			# Extract image metadata about solar position
@@ -368,24 +389,24 @@ class functions():
 			SA_rad = ee.Image.constant(ee.Number(img.get('SOLAR_AZIMUTH_ANGLE'))).multiply(degree2radian).clip(img.geometry().buffer(10000)); 
 			
 				
-			# Creat terrain layers
-			slp = ee.Terrain.slope(dem).clip(img.geometry().buffer(10000));
-			slp_rad = ee.Terrain.slope(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
-			asp_rad = ee.Terrain.aspect(dem).multiply(degree2radian).clip(img.geometry().buffer(10000));
+			# terrain layers
+			layers = self.terrainLayers.clip(img.geometry().buffer(10000))
+			slp = layers.select('slope');
+			asp_rad = layers.select('aspect_rad');
   
   
 			
 			# Calculate the Illumination Condition (IC)
 			# slope part of the illumination condition
 			cosZ = SZ_rad.cos();
-			cosS = slp_rad.cos();
+			cosS = layers.select('cosS');
 			slope_illumination = cosS.expression("cosZ * cosS", \
-												{'cosZ': cosZ, 'cosS': cosS.select('slope')});
+												{'cosZ': cosZ, 'cosS': cosS});
 			
 			
 			# aspect part of the illumination condition
 			sinZ = SZ_rad.sin(); 
-			sinS = slp_rad.sin();
+			sinS = layers.select('sinS');
 			cosAziDiff = (SA_rad.subtract(asp_rad)).cos();
 			aspect_illumination = sinZ.expression("sinZ * sinS * cosAziDiff", \
                                            {'sinZ': sinZ, \
@@ -414,56 +435,14 @@ class functions():
 			bandList = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']; # Specify Bands to topographically correct
     
 
-			def applyBands(image):
-				blue = apply_SCSccorr('blue').select(['blue'])
-				green = apply_SCSccorr('green').select(['green'])
-				red = apply_SCSccorr('red').select(['red'])
-				nir = apply_SCSccorr('nir').select(['nir'])
-				swir1 = apply_SCSccorr('swir1').select(['swir1'])
-				swir2 = apply_SCSccorr('swir2').select(['swir2'])
-				return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-			def apply_SCSccorr(band):
-				method = 'SCSc';
-						
-				out = ee.Image(1).addBands(img_plus_ic_mask2.select('IC', band)).reduceRegion(reducer= ee.Reducer.linearRegression(2,1), \
-  																	   geometry= ee.Geometry(img.geometry().buffer(-5000)), \
-																		scale= self.env.terrainScale, \
-																		bestEffort =True,
-																		maxPixels=1e10)
-																		
-				
-				#out_a = ee.Number(out.get('scale'));
-				#out_b = ee.Number(out.get('offset'));
-				#out_c = ee.Number(out.get('offset')).divide(ee.Number(out.get('scale')));
-				
-				
-				fit = out.combine({"coefficients": ee.Array([[1],[1]])}, False);
-
-				#Get the coefficients as a nested list, 
-				#cast it to an array, and get just the selected column
-				out_a = (ee.Array(fit.get('coefficients')).get([0,0]));
-				out_b = (ee.Array(fit.get('coefficients')).get([1,0]));
-				out_c = out_a.divide(out_b)
-
-					
-				# apply the SCSc correction
-				SCSc_output = img_plus_ic_mask2.expression("((image * (cosB * cosZ + cvalue)) / (ic + cvalue))", {
-																'image': img_plus_ic_mask2.select([band]),
-																'ic': img_plus_ic_mask2.select('IC'),
-																'cosB': img_plus_ic_mask2.select('cosS'),
-																'cosZ': img_plus_ic_mask2.select('cosZ'),
-																'cvalue': out_c });
-		  
-				return ee.Image(SCSc_output);
-																	  
-			#img_SCSccorr = ee.Image([apply_SCSccorr(band) for band in bandList]).addBands(img_plus_ic.select('IC'));
-			img_SCSccorr = applyBands(img).select(bandList).addBands(img_plus_ic.select('IC'))
+			# one regression for all bands
+			img_SCSccorr = topography.scsc(img_plus_ic_mask2, bandList, ee.Geometry(img.geometry().buffer(-5000)), self.env.terrainScale) \
+										 .addBands(img_plus_ic.select('IC'))
 		
 			bandList_IC = ee.List([bandList, 'IC']).flatten();
 			
 			img_SCSccorr = img_SCSccorr.unmask(img_plus_ic.select(bandList_IC)).select(bandList);
-  			
+			
 			return img_SCSccorr.unmask(img_plus_ic.select(bandList)) 
 	
 		
@@ -473,7 +452,7 @@ class functions():
 		
 		return img.addBands(otherBands)
 
-  	
+	
  
 	def brdf(self,img):   
 		
@@ -481,28 +460,6 @@ class functions():
 		import view_angles
 
 	
-		def _apply(image, kvol, kvol0):
-			blue = _correct_band(image, 'blue', kvol, kvol0, f_iso=0.0774, f_geo=0.0079, f_vol=0.0372)
-			green = _correct_band(image, 'green', kvol, kvol0, f_iso=0.1306, f_geo=0.0178, f_vol=0.0580)
-			red = _correct_band(image, 'red', kvol, kvol0, f_iso=0.1690, f_geo=0.0227, f_vol=0.0574)
-			nir = _correct_band(image, 'nir', kvol, kvol0, f_iso=0.3093, f_geo=0.0330, f_vol=0.1535)
-			swir1 = _correct_band(image, 'swir1', kvol, kvol0, f_iso=0.3430, f_geo=0.0453, f_vol=0.1154)
-			swir2 = _correct_band(image, 'swir2', kvol, kvol0, f_iso=0.2658, f_geo=0.0387, f_vol=0.0639)
-			return replace_bands(image, [blue, green, red, nir, swir1, swir2])
-
-
-		def _correct_band(image, band_name, kvol, kvol0, f_iso, f_geo, f_vol):
-			"""fiso + fvol * kvol + fgeo * kgeo"""
-			iso = ee.Image(f_iso)
-			geo = ee.Image(f_geo)
-			vol = ee.Image(f_vol)
-			pred = vol.multiply(kvol).add(geo.multiply(kvol)).add(iso).rename(['pred'])
-			pred0 = vol.multiply(kvol0).add(geo.multiply(kvol0)).add(iso).rename(['pred0'])
-			cfac = pred0.divide(pred).rename(['cfac'])
-			corr = image.select(band_name).multiply(cfac).rename([band_name])
-			return corr
-
-
 		def _kvol(sunAz, sunZen, viewAz, viewZen):
 			"""Calculate kvol kernel.
 			From Lucht et al. 2000
@@ -542,12 +499,12 @@ class functions():
 
 			return (kvol, kvol0)
          
- 		date = img.date()
+		date = img.date()
 		footprint = determine_footprint(img)
 		(sunAz, sunZen) = sun_angles.create(date, footprint)
-		(viewAz, viewZen) = view_angles.create(footprint)
+		(viewAz, viewZen) = view_angles.create(footprint, self.env.viewZenithMethod)
 		(kvol, kvol0) = _kvol(sunAz, sunZen, viewAz, viewZen)
-		return _apply(img, kvol.multiply(PI()), kvol0.multiply(PI()))
+		return brdf_correction.apply(img, kvol.multiply(PI()), kvol0.multiply(PI()), brdf_correction.LANDSAT_COEFFICIENTS)
 
 	def medoidMosaic(self,collection):
 		""" medoid composite with equal weight among indices """
@@ -557,55 +514,28 @@ class functions():
 
 		others = collection.select(otherBands).reduce(ee.Reducer.mean()).rename(otherBands);
 		
-		collection = collection.select(self.env.divideBands)
-
-		bandNumbers = ee.List.sequence(1,self.env.divideBands.length());
-
-		median = ee.ImageCollection(collection).median()
-        
-		def subtractmedian(img):
-			diff = ee.Image(img).subtract(median).pow(ee.Image.constant(2));
-			return diff.reduce('sum').addBands(img);
-        
-		medoid = collection.map(subtractmedian)
-  
-		medoid = ee.ImageCollection(medoid).reduce(ee.Reducer.min(self.env.divideBands.length().add(1))).select(bandNumbers,self.env.divideBands);
+		medoid = medoids.mosaic(collection,self.env.divideBands)
   
 		return medoid.addBands(others).addBands(nImages);	
 
 
-	def medoidMosaicPercentiles(self,inCollection,p):
-		' calculate the medoid of a percentile'
+	def percentileMedoids(self,inCollection):
+		' medoids of every percentile used by medoidMosaicPercentiles, from one pass'
 		
-		inCollection = inCollection.select(self.env.medoidBands)
+		percentiles = sorted(set(self.env.percentiles + [100 - p for p in self.env.percentiles]))
+		return medoids.percentile_mosaics(inCollection,self.env.medoidBands,percentiles)
+
+	def medoidMosaicPercentiles(self,percentileMedoids,p):
+		' calculate the medoid of a percentile'
 		
 		p1 = p
 		p2 = 100 -p
 		
-		med1 = self.medoidPercentiles(inCollection,p1).select(["green","nir"])
-		med2 = self.medoidPercentiles(inCollection,p2).select(["blue","red","swir1","swir2"])
+		med1 = percentileMedoids[p1].select(["green","nir"])
+		med2 = percentileMedoids[p2].select(["blue","red","swir1","swir2"])
   
 		medoidP = self.renameBands(ee.Image(med1).addBands(med2),str("p")+str(p))
 		return medoidP
-  
-
-	def medoidPercentiles(self,inCollection,p):
-
-		# Find band names in first image
-		bandNumbers = ee.List.sequence(1,self.env.medoidBands.length());
-
-		# Find the median
-		percentile = inCollection.select(self.env.medoidBands).reduce(ee.Reducer.percentile([p]));
-		
-		def subtractPercentile(img):
-			diff = ee.Image(img).subtract(percentile).pow(ee.Image.constant(2));
-			return diff.reduce('sum').addBands(img);
-		
-		percentile = inCollection.map(subtractPercentile)
-		
-		percentile = ee.ImageCollection(percentile).reduce(ee.Reducer.min(self.env.medoidBands.length().add(1))).select(bandNumbers,self.env.medoidBands);
-  
-		return percentile;
 
 
 	def renameBands(self,image,prefix):
@@ -647,22 +577,18 @@ class functions():
 		return img
 	def exportMap(self,img,studyArea):
 
-		geom  = studyArea.getInfo();
-		sd = str(self.env.startDate.getRelative('day','year').getInfo()).zfill(3);
-		ed = str(self.env.endDate.getRelative('day','year').getInfo()).zfill(3);
-		year = str(self.env.startDate.get('year').getInfo());
-		regionName = self.env.regionName.replace(" ",'_') + "_"
+		name = biweekly.export_name(self.env.name,self.env.regionName,self.env.exportDates[0],self.env.exportDates[1])
 
 		task_ordered= ee.batch.Export.image.toAsset(image=img, 
-								  description = self.env.name + regionName + year + sd + ed, 
-								  assetId= self.env.assetId + self.env.name + regionName + year + sd + ed,
-								  region=geom['coordinates'], 
+								  description = name, 
+								  assetId= self.env.assetId + name,
+								  region=biweekly.export_region(self.env.regionName,studyArea), 
 								  maxPixels=1e13,
 								  crs=self.env.epsg,
 								  scale=self.env.exportScale)
 	
 		task_ordered.start()
-		print(self.env.assetId + self.env.name + regionName + year + sd + ed)
+		print(self.env.assetId + name)
         
 #def composite(aoi,year):
 #	img = ee.Image(functions().getLandsat(aoi,year))
@@ -677,8 +603,7 @@ if __name__ == "__main__":
         year = 2009 + i
  
         regionName = 'SIERRA'
-        studyArea =  ee.FeatureCollection("projects/Sacha/AncillaryData/StudyRegions/Ecuador_EcoRegions_Complete")
-        studyArea = studyArea.filterMetadata('PROVINCIA','equals',regionName).geometry().bounds()
+        studyArea = regions.bounds(regionName)
         
         print(functions().getLandsat(studyArea,year,regionName))
 
@@ -0,0 +1,46 @@
+# medoid compositing helpers
+
+import ee
+
+
+def _closest(stack, count, target, bands):
+    """Observation of stack ([time, band]) nearest to target ([1, band]) as a band image."""
+    distance = stack.subtract(target.arrayRepeat(0, count)).pow(2).arrayReduce(ee.Reducer.sum(), [1])
+    return stack.arraySort(distance).arraySlice(0, 0, 1).arrayProject([1]) \
+        .updateMask(count.gt(0)).arrayFlatten([bands])
+
+
+def mosaic(collection, bands):
+    """Per-pixel medoid of bands: the observation closest to the band medians.
+
+    The collection is stacked into one [time, band] array per pixel, so the
+    median, the squared distances and the arg min are a single array pass
+    instead of a second mapped collection and a min(n + 1) reduce.
+    Observations masked in any band are left out; pixels without any stay
+    masked.
+    """
+    stack = ee.ImageCollection(collection).select(bands).toArray()
+    count = stack.arrayLength(0)
+    median = stack.arrayReduce(ee.Reducer.median(), [0])
+    return _closest(stack, count, median, bands)
+
+
+def percentile_mosaics(collection, bands, percentiles):
+    """Dict of percentile -> image of the observation closest to that percentile of bands.
+
+    All percentiles come from one percentile(percentiles) reduce, and the
+    medoids are then picked from the same array stack as in mosaic.
+    """
+    collection = ee.ImageCollection(collection).select(bands)
+    bands = ee.List(bands)
+    stack = collection.toArray()
+    count = stack.arrayLength(0)
+    reduced = collection.reduce(ee.Reducer.percentile(percentiles))
+    shape = ee.Image.constant(ee.List([1, bands.length()])).toArray()
+
+    result = {}
+    for p in percentiles:
+        names = bands.map(lambda band: ee.String(band).cat('_p' + str(p)))
+        target = reduced.select(names).toArray().arrayReshape(shape, 2)
+        result[p] = _closest(stack, count, target, bands)
+    return result
@@ -0,0 +1,131 @@
+# NumPy version of medoids for composites computed locally
+
+import sys
+import time
+import warnings
+
+import numpy as np
+
+# rows of a tile evaluated at once
+CHUNK_ROWS = 128
+
+
+def _valid(stack, mask):
+    """(time, y, x) boolean of the observations present in every band."""
+    if isinstance(stack, np.ma.MaskedArray):
+        valid = ~np.ma.getmaskarray(stack).any(axis=1)
+    else:
+        valid = np.ones((stack.shape[0],) + stack.shape[2:], dtype=bool)
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+    return valid
+
+
+def chunks(stack, mask, chunkRows):
+    """(rows, float64 values with NaN for invalid observations, valid) per block of rows."""
+    data = np.ma.getdata(stack)
+    valid = _valid(stack, mask)
+    nRows = data.shape[2]
+    for start in range(0, nRows, chunkRows):
+        rows = slice(start, min(start + chunkRows, nRows))
+        values = data[:, :, rows].astype(np.float64)
+        ok = valid[:, rows]
+        values[np.broadcast_to(~ok[:, None], values.shape)] = np.nan
+        yield rows, values, ok
+
+
+def _closest(values, ok, target):
+    """Observation of values (time, band, y, x) nearest to target (band, y, x)."""
+    distance = ((values - target) ** 2).sum(axis=1)
+    distance[~ok] = np.inf
+    first = distance.argmin(axis=0)
+
+    medoid = np.take_along_axis(values, first[None, None], axis=0)[0]
+    medoid[:, ~ok.any(axis=0)] = np.nan
+    return medoid
+
+
+def nanpercentile(values, percentiles):
+    """np.nanpercentile along axis 0 (linear interpolation) from one sort.
+
+    np.nanpercentile falls back to a per-pixel loop when NaNs are present.
+    """
+    ordered = np.sort(values, axis=0)  # NaNs last
+    last = (~np.isnan(values)).sum(axis=0) - 1
+    targets = []
+    for p in percentiles:
+        position = np.maximum(last, 0) * (p / 100.0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, np.maximum(last, 0))
+        low = np.take_along_axis(ordered, below[None], axis=0)[0]
+        high = np.take_along_axis(ordered, above[None], axis=0)[0]
+        target = low + (high - low) * (position - below)
+        target[last < 0] = np.nan
+        targets.append(target)
+    return targets
+
+
+def mosaic(stack, mask=None, chunkRows=CHUNK_ROWS):
+    """medoids.mosaic for a (time, band, y, x) stack.
+
+    Invalid observations are given by mask (time, y, x; True is valid) or by
+    the mask of a masked array. Rows are processed chunkRows at a time, so
+    only one chunk is held in float64. Returns a (band, y, x) float32 array,
+    NaN where a pixel has no valid observation.
+    """
+    nTime, nBands, nRows, nCols = stack.shape
+    out = np.full((nBands, nRows, nCols), np.nan, dtype=np.float32)
+
+    for rows, values, ok in chunks(stack, mask, chunkRows):
+        median = nanpercentile(values, [50])[0]
+        out[:, rows] = _closest(values, ok, median)
+
+    return out
+
+
+def percentile_mosaics(stack, percentiles, mask=None, chunkRows=CHUNK_ROWS):
+    """medoids.percentile_mosaics: dict of percentile -> (band, y, x) float32."""
+    nTime, nBands, nRows, nCols = stack.shape
+    out = dict((p, np.full((nBands, nRows, nCols), np.nan, dtype=np.float32)) for p in percentiles)
+
+    for rows, values, ok in chunks(stack, mask, chunkRows):
+        for p, target in zip(percentiles, nanpercentile(values, percentiles)):
+            out[p][:, rows] = _closest(values, ok, target)
+
+    return out
+
+
+def _reference(stack, valid):
+    """medoidMosaic as written before: median, distance collection, then min(n + 1)."""
+    values = np.where(valid[:, None], stack, np.nan).astype(np.float64)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(values, axis=0)
+    withDistance = np.concatenate([((values - median) ** 2).sum(axis=1)[:, None], values], axis=1)
+    withDistance[:, 0][~valid] = np.inf
+    first = withDistance[:, 0].argmin(axis=0)
+    return np.take_along_axis(withDistance, first[None, None], axis=0)[0, 1:].astype(np.float32)
+
+
+if __name__ == "__main__":
+
+    # python medoids_numpy.py [scenes] [pixels per side]
+    nTime = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    rng = np.random.RandomState(0)
+    stack = rng.uniform(0, 0.5, size=(nTime, 6, size, size)).astype(np.float32)
+    clear = rng.uniform(size=(nTime, size, size)) > 0.4
+
+    start = time.time()
+    reference = _reference(stack, clear)
+    referenceTime = time.time() - start
+
+    start = time.time()
+    result = mosaic(stack, clear)
+    elapsed = time.time() - start
+
+    pixels = size * size
+    print("reference: %.2fs, chunked: %.2fs (%.0f pixels/s) for %d scenes" % (referenceTime, elapsed, pixels / elapsed, nTime))
+    print("identical: " + str(np.array_equal(np.isnan(result), np.isnan(reference))
+                              and np.allclose(np.nan_to_num(result), np.nan_to_num(reference))))
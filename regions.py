@@ -0,0 +1,83 @@
+# study region helpers
+
+import ee
+import json
+import os
+import threading
+
+COLLECTION = "projects/Sacha/AncillaryData/StudyRegions/Ecuador_EcoRegions_Complete"
+FIELD = "PROVINCIA"
+
+# local GeoJSON store of the region bounds
+PATH = "region_bounds.geojson"
+
+# features per region name
+_features = {}
+_lock = threading.Lock()
+
+
+def _load(path):
+    if not _features and os.path.exists(path):
+        with open(path) as f:
+            for feature in json.load(f)['features']:
+                _features[feature['id']] = feature
+
+
+def _fetch(names):
+    """Bounds of every name, dissolved in one request."""
+    collection = ee.FeatureCollection(COLLECTION)
+
+    def region(name):
+        regions = collection.filter(ee.Filter.eq(FIELD, name))
+        return ee.Feature(regions.geometry().bounds(), {FIELD: name, 'count': regions.size()})
+
+    return ee.FeatureCollection(ee.List(names).map(region)).getInfo()['features']
+
+
+def resolve(names, path=PATH):
+    """Resolve region names to local GeoJSON features of their bounds, once.
+
+    Names not in the store at path are dissolved on the server together and
+    added to it. Later calls, in this process or the next, read the store.
+    Remove it when the region collection changes.
+    """
+    with _lock:
+        _load(path)
+        missing = [name for name in names if name not in _features]
+        if missing:
+            for feature in _fetch(missing):
+                name = feature['properties'][FIELD]
+                if not feature['properties']['count']:
+                    raise ValueError("no region named " + name + " in " + COLLECTION)
+                feature['id'] = name
+                _features[name] = feature
+
+            with open(path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': [_features[name] for name in sorted(_features)]}, f)
+        return [_features[name] for name in names]
+
+
+def bounds(name, path=PATH):
+    """Bounds of the region, as geometry().bounds() of the filtered collection: a planar rectangle."""
+    return ee.Geometry.Polygon(bounds_coordinates(name, path), None, False)
+
+
+def bounds_coordinates(name, path=PATH):
+    """Coordinates of bounds(name), ready for the region of an export."""
+    return resolve([name], path)[0]['geometry']['coordinates']
+
+
+def known(name, path=PATH):
+    """True if the region is in the store already."""
+    with _lock:
+        _load(path)
+        return name in _features
+
+
+if __name__ == "__main__":
+
+    ee.Initialize()
+
+    # python regions.py resolves the regions the pipelines run on
+    for feature in resolve(['AMAZONIA NOROCCIDENTAL', 'SIERRA']):
+        print("%s: %s" % (feature['id'], feature['geometry']['coordinates']))
@@ -1,28 +1,34 @@
 # Sentinel-2 package
 
 import ee
-from Py6S import *
 import math
 import datetime
 import os, sys
 from utils import *
-sys.path.append("/gee-atmcorr-S2/bin")
-from atmospheric import Atmospheric
+import atmcorr
+import tdom
+import topography
+import brdf_correction
+import medoids
 import sun_angles
 import view_angles
+import biweekly
+import regions
 import time
 
 class env(object):
 
-	def __init__(self):
+	def __init__(self,initialize=True):
 		"""Initialize the environment."""
 
 		# Initialize the Earth Engine object, using the authentication credentials.
-		ee.Initialize()
+		if initialize:
+			ee.Initialize()
 		
 		self.dem =  ee.Image("JAXA/ALOS/AW3D30_V1_1").select(["AVE"])
+		self.demName = "ALOS_AVE"
 		self.epsg = "EPSG:32717"	
-		self.feature = 0	
+		
 		##########################################
 		# variable for the getSentinel algorithm #
 		##########################################
@@ -54,6 +60,15 @@ class env(object):
 		self.dilatePixels = 3.5;	
 		
 		
+		##########################################
+		# variable for the TDOM statistics       #
+		##########################################
+		
+		# the per-pixel mean/stdDev used by TDOM are stored as assets per sensor,
+		# region and epoch; change tdomEpoch to recompute them for a grown archive
+		self.tdomAssetRoot = "projects/Sacha/AncillaryData/TDOM/"
+		self.tdomEpoch = "2019"
+		
 		##########################################
 		# variable for cloudScore  algorithm     #
 		##########################################	
@@ -74,6 +89,37 @@ class env(object):
 		##########################################		
 		
 		self.terrainScale = 1000
+		
+		# slope, aspect and their trigonometry are stored per DEM, region and
+		# projection at the native DEM resolution
+		self.terrainAssetRoot = "projects/Sacha/AncillaryData/Terrain/"
+		self.demScale = 30
+		
+		# local index of the 80th percentile slope per MGRS tile and DEM, used to pick
+		# the scenes that get terrain corrected
+		self.tileSlopePath = "s2_tile_slopes.json"
+
+		##########################################
+		# variable for brdf correction           #
+		##########################################		
+		
+		# zenithMethod of view_angles.create
+		self.viewZenithMethod = 'distance'
+
+		##########################################
+		# variable for atmospheric correction    #
+		##########################################		
+		
+		# number of processes running 6S
+		self.srWorkers = 4
+		
+		# on-disk cache of 6S outputs keyed by the quantized atmospheric state
+		self.sixsCachePath = "sixs_cache.sqlite"
+		
+		# '6S' runs Py6S per band, 'emulator' interpolates the lookup table
+		# built with sixs_emulator.py
+		self.srEngine = '6S'
+		self.emulatorPath = "sixs_emulator.npy"
 
 		##########################################
 		# Export variables		  		         #
@@ -83,6 +129,9 @@ class env(object):
 		self.name = "S2_BW_" 
 		self.exportScale = 20
 		
+		# optional biweekly.TaskQueue; export tasks are started directly when None
+		self.taskQueue = None
+		
 		##########################################
 		# variable band selection  		         #
 		##########################################		
@@ -104,23 +153,29 @@ class env(object):
 
 
 class functions():       
-	def __init__(self):
+	def __init__(self,initialize=True):
 		"""Initialize the Surfrace Reflectance app."""  
  
 	    # get the environment
-		self.env = env() 
+		self.env = env(initialize) 
+		
+		# 6S coefficients per scene id, reused across calls
+		self.srCoefficients = {}
 	
 	
 	def main(self,studyArea,startDate,endDate,startDay,endDay,week,regionName):
 		
 		self.env.regionName = regionName
-		self.env.startDate = startDate
-		self.env.endDate = endDate
+		self.env.startDate = ee.Date(startDate)
+		self.env.endDate = ee.Date(endDate)
+		
+		# python dates, to name the export without getInfo calls
+		self.env.exportDates = [startDate,endDate]
 		
 		self.env.startDoy = startDay
 		self.env.endDoy = endDay
 		
-		s2 = self.getSentinel2(startDate,endDate,studyArea);
+		s2 = self.getSentinel2(self.env.startDate,self.env.endDate,studyArea);
 
 		#print(s2.size().getInfo())
 		if s2.size().getInfo() > 0:		
@@ -129,14 +184,18 @@ class functions():
 			# print(self.env.endDate.getInfo())
 
 			
+			# scene metadata comes from the raw collection: scaleS2 keeps only
+			# a few properties and drops the SOLAR_IRRADIANCE_* values
+			if self.env.calcSR == True:
+				self.collectionMeta = self.getCollectionMeta(s2)
+			
 			s2 = s2.map(self.scaleS2)
 			
 			# masking the shadows
 			print("Masking shadows..") 
 			if self.env.shadowMask == True:
 				s2 = self.maskShadows(s2,studyArea)
-				
-			self.collectionMeta = s2.getInfo()['features']
+
 			#print(ee.Image(s2.first()).get('system:time_start').getInfo())
 
 			print("rename bands, add date..")
@@ -160,7 +219,7 @@ class functions():
 			if self.env.calcSR  == True:
 				s2 = s2.select(self.env.s2BandsOut,self.env.s2BandsIn)
 				print("applying atmospheric correction")
-				s2 = s2.map(self.TOAtoSR).select(self.env.s2BandsIn,self.env.s2BandsOut)
+				s2 = self.TOAtoSR(s2).select(self.env.s2BandsIn,self.env.s2BandsOut)
 			#print(ee.Image(s2.first()).getInfo())
 
 				
@@ -170,6 +229,9 @@ class functions():
 					
 			if self.env.terrainCorrection == True:
 				print("apply terrain correction..")
+				self.terrainLayers = topography.derivatives(self.env.dem,self.env.demName,studyArea,self.env.regionName, \
+															self.env.terrainAssetRoot,self.env.epsg,self.env.demScale)
+				self.tileSlopes = topography.tile_slopes(self.getSentinel2(self.env.startDate,self.env.endDate,studyArea),self.env.dem,self.env.demName,self.env.tileSlopePath)
 				s2 = s2.map(self.getTopo)
 				corrected = s2.filter(ee.Filter.gt("slope",20))
 				notCorrected = s2.filter(ee.Filter.lt("slope",20))
@@ -187,7 +249,7 @@ class functions():
 			img = self.setMetaData(img)
 
 			print("exporting composite")
-			self.exportMap(img,studyArea,week)
+			return self.exportMap(img,studyArea,week)
 			#print(img.getInfo()['properties'])
 
 	def getSentinel2(self,start,end,studyArea):
@@ -231,8 +293,8 @@ class functions():
 		allCollection = ee.ImageCollection('COPERNICUS/S2').filterBounds(studyArea)
 	                                           
 		# Get some pixel-wise stats for the time series
-		irStdDev = allCollection.select(shadowSumBands).reduce(ee.Reducer.stdDev())
-		irMean = allCollection.select(shadowSumBands).reduce(ee.Reducer.mean())
+		irMean, irStdDev = tdom.statistics(allCollection,shadowSumBands,'S2',studyArea,self.env.regionName,self.env.tdomEpoch, \
+										   self.env.tdomAssetRoot,self.env.epsg,self.env.exportScale)
 
 		# Mask out dark dark outliers
 		collection_tdom = collection.map(TDOM)
@@ -241,15 +303,7 @@ class functions():
 
 	def getTopo(self,img):
 		''' funtion to filter for areas with terrain and areas without'''
-		dem = self.env.dem.unmask(0)
-		geom = ee.Geometry(img.get('system:footprint')).bounds()
-		slp_rad = ee.Terrain.slope(dem).clip(geom);
-		
-		slope = slp_rad.reduceRegion(reducer= ee.Reducer.percentile([80]), \
-									 geometry= geom,\
-									 scale= 100 ,\
-									 maxPixels=10000000)
-		return img.set('slope',slope.get('slope'))
+		return img.set('slope',self.tileSlopes.get(img.get('MGRS_TILE'),0))
 
 	def scaleS2(self,img):
 		
@@ -259,7 +313,7 @@ class functions():
 		
 		others = img.select(otherBands)
 		out = img.select(divideBands).divide(10000)
-		return out.addBands(others).copyProperties(img,['system:time_start','system:footprint','MEAN_SOLAR_ZENITH_ANGLE','MEAN_SOLAR_AZIMUTH_ANGLE']).set("centroid",img.geometry().centroid());
+		return out.addBands(others).copyProperties(img,['system:time_start','system:footprint','MEAN_SOLAR_ZENITH_ANGLE','MEAN_SOLAR_AZIMUTH_ANGLE','MGRS_TILE']).set("centroid",img.geometry().centroid());
 
 	def reScaleS2(self,img):
 		
@@ -284,121 +338,33 @@ class functions():
 		
 		return img.set("pixelArea",area.get("red"))
 
-	def TOAtoSR(self,img):
+	def getCollectionMeta(self,collection):
+		""" fetch the per-scene properties used by TOAtoSR, keyed by system:index """
 		
-		TDOMMask = img.select(['TDOMMask'])
-		info = self.collectionMeta[self.env.feature]['properties']
-		scene_date = datetime.datetime.utcfromtimestamp(info['system:time_start']/1000)# i.e. Python uses seconds, EE uses milliseconds
-		solar_z = info['MEAN_SOLAR_ZENITH_ANGLE']
-        
-		geom = ee.Geometry(info['system:footprint']).centroid()	
-		#geom = ee.Geometry.Point([info['centroid']['coordinates'][0],info['centroid']['coordinates'][1]])
-		date = ee.Date.fromYMD(scene_date.year,scene_date.month,scene_date.day)
+		properties = ['system:time_start','system:footprint','MEAN_SOLAR_ZENITH_ANGLE'] + ['SOLAR_IRRADIANCE_' + band for band in atmcorr.S2_BANDS]
 		
-		h2o = Atmospheric.water(geom,date).getInfo()
-		o3 = Atmospheric.ozone(geom,date).getInfo()
-		aot = Atmospheric.aerosol(geom,date).getInfo()
+		return fetch_properties(collection,properties)
 
-		SRTM = ee.Image('CGIAR/SRTM90_V4')# Shuttle Radar Topography mission covers *most* of the Earth
-		alt = SRTM.reduceRegion(reducer = ee.Reducer.mean(),geometry = geom).get('elevation').getInfo()
-		
-		if alt:
-			km = alt/1000 # i.e. Py6S uses units of kilometers
+	def TOAtoSR(self,collection):
+		""" 6S correction with per-scene coefficients looked up by system:index """
 		
+		if self.env.srEngine == 'emulator':
+			import sixs_emulator
+			emulator = sixs_emulator.Emulator(self.env.emulatorPath)
+			self.srCoefficients = atmcorr.compute(self.collectionMeta,self.srCoefficients,emulator=emulator)
 		else:
-			km = 0
-		# Instantiate
-		s = SixS()
-		
-		# Atmospheric constituents
-		s.atmos_profile = AtmosProfile.UserWaterAndOzone(h2o,o3)
-		s.aero_profile = AeroProfile.Continental
-		s.aot550 = aot
-		
-		# Earth-Sun-satellite geometry
-		s.geometry = Geometry.User()
-		s.geometry.view_z = 0               # always NADIR (I think..)
-		s.geometry.solar_z = solar_z        # solar zenith angle
-		s.geometry.month = scene_date.month # month and day used for Earth-Sun distance
-		s.geometry.day = scene_date.day     # month and day used for Earth-Sun distance
-		s.altitudes.set_sensor_satellite_level()
-		s.altitudes.set_target_custom_altitude(km)
-		
-		def spectralResponseFunction(bandname):
-			"""
-			Extract spectral response function for given band name
-			"""
-            
-			bandSelect = {
-				'B1':PredefinedWavelengths.S2A_MSI_01,
-				'B2':PredefinedWavelengths.S2A_MSI_02,
-				'B3':PredefinedWavelengths.S2A_MSI_03,
-				'B4':PredefinedWavelengths.S2A_MSI_04,
-				'B5':PredefinedWavelengths.S2A_MSI_05,
-				'B6':PredefinedWavelengths.S2A_MSI_06,
-				'B7':PredefinedWavelengths.S2A_MSI_07,
-				'B8':PredefinedWavelengths.S2A_MSI_08,
-				'B8A':PredefinedWavelengths.S2A_MSI_09,
-				'B9':PredefinedWavelengths.S2A_MSI_10,
-				'B10':PredefinedWavelengths.S2A_MSI_11,
-				'B11':PredefinedWavelengths.S2A_MSI_12,
-				'B12':PredefinedWavelengths.S2A_MSI_13}
-								    
-			return Wavelength(bandSelect[bandname])
-
-		def toa_to_rad(bandname):
-			"""
-			Converts top of atmosphere reflectance to at-sensor radiance
-			"""
-			
-			# solar exoatmospheric spectral irradiance
-			ESUN = info['SOLAR_IRRADIANCE_'+bandname]
-			solar_angle_correction = math.cos(math.radians(solar_z))
-			
-			# Earth-Sun distance (from day of year)
-			doy = scene_date.timetuple().tm_yday
-			d = 1 - 0.01672 * math.cos(0.9856 * (doy-4))# http://physics.stackexchange.com/questions/177949/earth-sun-distance-on-a-given-day-of-the-year
-			
-			# conversion factor
-			multiplier = ESUN*solar_angle_correction/(math.pi*d**2)
-			
-			# at-sensor radiance
-			rad = img.select(bandname).multiply(multiplier)
-			return rad
-			
+			with atmcorr.SixSCache(self.env.sixsCachePath) as cache:
+				self.srCoefficients = atmcorr.compute(self.collectionMeta,self.srCoefficients,self.env.srWorkers,cache=cache)
+				print("6S cache: " + str(cache.stats()))
 		
-		def surface_reflectance(bandname):
-			"""
-			Calculate surface reflectance from at-sensor radiance given waveband name
-			"""
-			
-			# run 6S for this waveband
-			s.wavelength = spectralResponseFunction(bandname)
-			s.run()
-			
-			# extract 6S outputs
-			Edir = s.outputs.direct_solar_irradiance             #direct solar irradiance
-			Edif = s.outputs.diffuse_solar_irradiance            #diffuse solar irradiance
-			Lp   = s.outputs.atmospheric_intrinsic_radiance      #path radiance
-			absorb  = s.outputs.trans['global_gas'].upward       #absorption transmissivity
-			scatter = s.outputs.trans['total_scattering'].upward #scattering transmissivity
-			tau2 = absorb*scatter                                #total transmissivity
-			
-			# radiance to surface reflectance
-			rad = toa_to_rad(bandname)
-			
-			ref = rad.subtract(Lp).multiply(math.pi).divide(tau2*(Edir+Edif))
-			
-			return ref
+		scenes = set(self.collectionMeta)
+		table = ee.Dictionary(dict((k,v) for k,v in self.srCoefficients.items() if k in scenes))
 		
-		# all wavebands
-		output = img.select('QA60')
-		for band in ['B1','B2','B3','B4','B5','B6','B7','B8','B8A','B9','B10','B11','B12']:
-			output = output.addBands(surface_reflectance(band))
-			
-		self.env.feature +=1
+		def correct(img):
+			output = img.select('QA60').addBands(atmcorr.correct(img,table))
+			return output.addBands(img.select(['TDOMMask'])).copyProperties(img,['system:time_start','system:footprint','MEAN_SOLAR_ZENITH_ANGLE','MEAN_SOLAR_AZIMUTH_ANGLE','MGRS_TILE'])
 		
-		return output.addBands(TDOMMask).copyProperties(img,['system:time_start','system:footprint','MEAN_SOLAR_ZENITH_ANGLE','MEAN_SOLAR_AZIMUTH_ANGLE'])
+		return collection.map(correct)
 
 	# Function to mask clouds using the Sentinel-2 QA band.
 	def QAMaskCloud(self,img):
@@ -493,32 +459,6 @@ class functions():
 		
 
 	
-		def _apply(image, kvol, kvol0):
-			blue = _correct_band(image, 'blue', kvol, kvol0, f_iso=0.0774, f_geo=0.0079, f_vol=0.0372)
-			green = _correct_band(image, 'green', kvol, kvol0, f_iso=0.1306, f_geo=0.0178, f_vol=0.0580)
-			red = _correct_band(image, 'red', kvol, kvol0, f_iso=0.1690, f_geo=0.0227, f_vol=0.0574)
-			re1 = _correct_band(image, 're1', kvol, kvol0, f_iso=0.2085, f_geo=0.0256, f_vol=0.0845)
-			re2 = _correct_band(image, 're2', kvol, kvol0, f_iso=0.2316, f_geo=0.0273, f_vol=0.1003)
-			re3 = _correct_band(image, 're3', kvol, kvol0, f_iso=0.2599, f_geo=0.0294, f_vol=0.1197)
-			nir = _correct_band(image, 'nir', kvol, kvol0, f_iso=0.3093, f_geo=0.0330, f_vol=0.1535)
-			re4 = _correct_band(image, 're4', kvol, kvol0, f_iso=0.2907, f_geo=0.0410, f_vol=0.1611)
-			swir1 = _correct_band(image, 'swir1', kvol, kvol0, f_iso=0.3430, f_geo=0.0453, f_vol=0.1154)
-			swir2 = _correct_band(image, 'swir2', kvol, kvol0, f_iso=0.2658, f_geo=0.0387, f_vol=0.0639)
-			return replace_bands(image, [blue, green, red,re1,re2,re3, nir,re4, swir1, swir2])
-
-
-		def _correct_band(image, band_name, kvol, kvol0, f_iso, f_geo, f_vol):
-			"""fiso + fvol * kvol + fgeo * kgeo"""
-			iso = ee.Image(f_iso)
-			geo = ee.Image(f_geo)
-			vol = ee.Image(f_vol)
-			pred = vol.multiply(kvol).add(geo.multiply(kvol)).add(iso).rename(['pred'])
-			pred0 = vol.multiply(kvol0).add(geo.multiply(kvol0)).add(iso).rename(['pred0'])
-			cfac = pred0.divide(pred).rename(['cfac'])
-			corr = image.select(band_name).multiply(cfac).rename([band_name])
-			return corr
-
-
 		def _kvol(sunAz, sunZen, viewAz, viewZen):
 			"""Calculate kvol kernel.
 			From Lucht et al. 2000
@@ -561,14 +501,14 @@ class functions():
 		date = img.date()
 		footprint =  ee.List(img.geometry().bounds().bounds().coordinates().get(0));
 		(sunAz, sunZen) = sun_angles.create(date, footprint)
-		(viewAz, viewZen) = view_angles.create(footprint)
+		(viewAz, viewZen) = view_angles.create(footprint, self.env.viewZenithMethod)
 		(kvol, kvol0) = _kvol(sunAz, sunZen, viewAz, viewZen)
 		
 		bandNames = img.bandNames()
 		otherBands = bandNames.removeAll(self.env.divideBands)
 		others = img.select(otherBands)
 						
-		img = ee.Image(_apply(img, kvol.multiply(PI()), kvol0.multiply(PI())))
+		img = ee.Image(brdf_correction.apply(img, kvol.multiply(PI()), kvol0.multiply(PI()), brdf_correction.S2_COEFFICIENTS))
 				
 		return img
 
@@ -576,7 +516,7 @@ class functions():
 		degree2radian = 0.01745;
 
 		geom = ee.Geometry(img.get('system:footprint')).bounds().buffer(10000) 
-		dem = self.env.dem
+		layers = self.terrainLayers.clip(geom)
 	
 		bandNames = img.bandNames()
 		otherBands = bandNames.removeAll(self.env.divideBands)
@@ -591,22 +531,21 @@ class functions():
 			SA_rad = ee.Image.constant(ee.Number(img.get('MEAN_SOLAR_AZIMUTH_ANGLE'))).multiply(degree2radian).clip(geom); 
 
 			
-			# Creat terrain layers
-			slp = ee.Terrain.slope(dem).clip(geom);
-			slp_rad = ee.Terrain.slope(dem).multiply(degree2radian).clip(geom);
-			asp_rad = ee.Terrain.aspect(dem).multiply(degree2radian).clip(geom);
+			# terrain layers
+			slp = layers.select('slope');
+			asp_rad = layers.select('aspect_rad');
   			
 
 			# Calculate the Illumination Condition (IC)
 			# slope part of the illumination condition
 			cosZ = SZ_rad.cos();
-			cosS = slp_rad.cos();
+			cosS = layers.select('cosS');
 			slope_illumination = cosS.expression("cosZ * cosS", \
-												{'cosZ': cosZ, 'cosS': cosS.select('slope')});
+												{'cosZ': cosZ, 'cosS': cosS});
 	
 			# aspect part of the illumination condition
 			sinZ = SZ_rad.sin(); 
-			sinS = slp_rad.sin();
+			sinS = layers.select('sinS');
 			cosAziDiff = (SA_rad.subtract(asp_rad)).cos();
 			aspect_illumination = sinZ.expression("sinZ * sinS * cosAziDiff", \
 											 {'sinZ': sinZ, \
@@ -633,36 +572,9 @@ class functions():
 
 			
 		
-			def apply_SCSccorr(band):
-				method = 'SCSc';
-						
-				out = ee.Image(1).addBands(img_plus_ic_mask2.select('IC', band)).reduceRegion(reducer= ee.Reducer.linearRegression(2,1), \
-  																	   geometry= ee.Geometry(img.geometry().buffer(-5000)), \
-																		scale= 300, \
-																		bestEffort =True,
-																		maxPixels=1e10)
-																					
-				
-				fit = out.combine({"coefficients": ee.Array([[1],[1]])}, False);
-
-				#Get the coefficients as a nested list, 
-				#cast it to an array, and get just the selected column
-				out_a = (ee.Array(fit.get('coefficients')).get([0,0]));
-				out_b = (ee.Array(fit.get('coefficients')).get([1,0]));
-				out_c = out_a.divide(out_b)
-
-					
-				# apply the SCSc correction
-				SCSc_output = img_plus_ic_mask2.expression("((image * (cosB * cosZ + cvalue)) / (ic + cvalue))", {
-																'image': img_plus_ic_mask2.select([band]),
-																'ic': img_plus_ic_mask2.select('IC'),
-																'cosB': img_plus_ic_mask2.select('cosS'),
-																'cosZ': img_plus_ic_mask2.select('cosZ'),
-																'cvalue': out_c });
-		  
-				return ee.Image(SCSc_output);
-			
-			img_SCSccorr = ee.Image([apply_SCSccorr(band) for band in bandList]).addBands(img_plus_ic.select('IC'));
+			# one regression for all bands
+			img_SCSccorr = topography.scsc(img_plus_ic_mask2, bandList, ee.Geometry(img.geometry().buffer(-5000)), 300) \
+										 .addBands(img_plus_ic.select('IC'))
 		
 			bandList_IC = ee.List([bandList, 'IC']).flatten();
 			
@@ -683,19 +595,7 @@ class functions():
 
 		others = collection.select(otherBands).reduce(ee.Reducer.mean()).rename(otherBands);
 		
-		collection = collection.select(self.env.divideBands)
-
-		bandNumbers = ee.List.sequence(1,self.env.divideBands.length());
-
-		median = ee.ImageCollection(collection).median()
-        
-		def subtractmedian(img):
-			diff = ee.Image(img).subtract(median).pow(ee.Image.constant(2));
-			return diff.reduce('sum').addBands(img);
-        
-		medoid = collection.map(subtractmedian)
-  
-		medoid = ee.ImageCollection(medoid).reduce(ee.Reducer.min(self.env.divideBands.length().add(1))).select(bandNumbers,self.env.divideBands);
+		medoid = medoids.mosaic(collection,self.env.divideBands)
   
 		return medoid.addBands(others);
 
@@ -739,42 +639,36 @@ class functions():
 
 	def exportMap(self,img,studyArea,week):
 
-		geom  = studyArea.bounds().getInfo();
-		sd = str(self.env.startDate.getRelative('day','year').getInfo()).zfill(3);
-		ed = str(self.env.endDate.getRelative('day','year').getInfo()).zfill(3);
-		year = str(self.env.startDate.get('year').getInfo());
-		regionName = self.env.regionName.replace(" ",'_') + "_"
+		name = biweekly.export_name(self.env.name,self.env.regionName,self.env.exportDates[0],self.env.exportDates[1],week)
 		
 		task_ordered= ee.batch.Export.image.toAsset(image=img.clip(studyArea.buffer(10000)), 
-								  description = self.env.name + regionName + str(week).zfill(3) +'_'+ year + sd + ed, 
-								  assetId= self.env.assetId + self.env.name + regionName + str(week).zfill(3)+'_'+ year + sd + ed,
-								  region=geom['coordinates'], 
+								  description = name, 
+								  assetId= self.env.assetId + name,
+								  region=biweekly.export_region(self.env.regionName,studyArea), 
 								  maxPixels=1e13,
 								  crs=self.env.epsg,
 								  scale=self.env.exportScale)
 	
+		if self.env.taskQueue:
+			return self.env.taskQueue.submit(task_ordered)
+		
 		task_ordered.start() 
+		return task_ordered
 
 if __name__ == "__main__":        
 
 	ee.Initialize()
 	
-	start = 1
-
-	for i in range(38,105,1):
-		#Jun 2015 starts at biweek 38
-		startWeek = start+ i
-		print(startWeek)
+	regionName = 'AMAZONIA NOROCCIDENTAL'
+	studyArea = regions.bounds(regionName)
 	
-		year = ee.Date("2014-01-01")
-		startDay = (startWeek -1) *14
-		endDay = (startWeek) *14 -1
+	queue = biweekly.TaskQueue()
 
-		startDate = year.advance(startDay,"day") 
-		endDate = year.advance(endDay,"day") 
+	def build(period):
+		print(period['week'])
+		app = functions(initialize=False)
+		app.env.taskQueue = queue
+		return app.main(studyArea,period['startDate'],period['endDate'],period['startDay'],period['endDay'],period['week'],regionName)
 
-		regionName = 'AMAZONIA NOROCCIDENTAL'
-		studyArea =  ee.FeatureCollection("projects/Sacha/AncillaryData/StudyRegions/Ecuador_EcoRegions_Complete")
-		studyArea = studyArea.filterMetadata('PROVINCIA','equals',regionName).geometry().bounds()
-		
-		print(functions().main(studyArea,startDate,endDate,startDay,endDay,startWeek,regionName))
\ No newline at end of file
+	#Jun 2015 starts at biweek 39
+	print(biweekly.run(build,biweekly.plan(39,105)))
\ No newline at end of file
@@ -0,0 +1,126 @@
+# 6S emulator: precomputed lookup tables of 6S outputs for the Sentinel-2 bands
+
+import datetime
+import itertools
+import json
+import math
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# grid of atmospheric states the table is computed on; values outside are clamped
+AXES = OrderedDict([
+    ('solar_z', [0, 10, 20, 30, 40, 50, 60, 70]),
+    ('h2o', [0, 1, 2, 3, 4, 5, 6, 8]),
+    ('o3', [0.2, 0.3, 0.4, 0.5]),
+    ('aot', [0, 0.1, 0.2, 0.4, 0.6, 1.0, 1.5]),
+    ('km', [0, 1, 2, 3, 4])])
+
+# outputs stored per grid point, in this order
+OUTPUTS = ['Edir', 'Edif', 'Lp', 'tau2']
+
+# the table is built for this date; other dates are scaled by the Earth-Sun distance
+REFERENCE_MONTH = 1
+REFERENCE_DAY = 4
+
+
+def _dsol(doy):
+    """Earth-Sun distance factor on irradiance as used by 6S (varsol)."""
+    return 1 / (1 - 0.01673 * math.cos(0.0172 * (doy - 4))) ** 2
+
+
+def build(path, bands=None, workers=4):
+    """Run 6S on every grid point and store the table as a .npy file next to its axes."""
+    import atmcorr
+    bands = bands or atmcorr.S2_BANDS
+    grid = list(itertools.product(*AXES.values()))
+    keys = [(band,) + point + (REFERENCE_MONTH, REFERENCE_DAY) for band in bands for point in grid]
+
+    shape = (len(bands),) + tuple(len(v) for v in AXES.values()) + (len(OUTPUTS),)
+    lut = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        outputs = pool.map(atmcorr.run_6s, keys, chunksize=64)
+        lut[...] = np.array(list(outputs), dtype=np.float32).reshape(shape)
+    lut.flush()
+
+    with open(path + '.json', 'w') as f:
+        json.dump({'bands': bands, 'axes': AXES, 'outputs': OUTPUTS,
+                   'month': REFERENCE_MONTH, 'day': REFERENCE_DAY}, f)
+
+
+class Emulator(object):
+    """Batched multilinear interpolation in a table written by build()."""
+
+    def __init__(self, path):
+        self.lut = np.load(path, mmap_mode='r')
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        self.bands = meta['bands']
+        self.axes = [np.asarray(v, dtype=np.float64) for v in meta['axes'].values()]
+        self.reference = _dsol(datetime.date(2001, meta['month'], meta['day']).timetuple().tm_yday)
+
+    def interpolate(self, points):
+        """points: (N, 5) array of solar_z, h2o, o3, aot, km -> (N, bands, outputs)."""
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        index = []
+        weight = []
+        for axis, grid in enumerate(self.axes):
+            x = np.clip(points[:, axis], grid[0], grid[-1])
+            i = np.clip(np.searchsorted(grid, x, side='right') - 1, 0, len(grid) - 2)
+            index.append(i)
+            weight.append((x - grid[i]) / (grid[i + 1] - grid[i]))
+
+        out = np.zeros((len(points), self.lut.shape[0], self.lut.shape[-1]))
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            w = np.ones(len(points))
+            for c, t in zip(corner, weight):
+                w *= t if c else 1 - t
+            values = self.lut[(slice(None),) + tuple(i + c for i, c in zip(index, corner))]
+            out += w[:, None, None] * np.transpose(values, (1, 0, 2))
+        return out
+
+    def outputs(self, points, doys):
+        """Like interpolate, with Edir, Edif and Lp scaled to each day of year."""
+        out = self.interpolate(points)
+        scale = np.array([_dsol(doy) for doy in doys]) / self.reference
+        out[:, :, :3] *= scale[:, None, None]
+        return out
+
+
+def benchmark(path, n=20, seed=0):
+    """Compare the emulator with exact 6S runs on random states."""
+    import atmcorr
+    emulator = Emulator(path)
+    rng = np.random.RandomState(seed)
+    lows = [v[0] for v in AXES.values()]
+    highs = [v[-1] for v in AXES.values()]
+    points = rng.uniform(lows, highs, size=(n, len(lows)))
+    doys = rng.randint(1, 366, size=n)
+    dates = [datetime.date(2001, 1, 1) + datetime.timedelta(days=int(doy) - 1) for doy in doys]
+
+    start = time.time()
+    approx = emulator.outputs(points, doys)
+    emulated = time.time() - start
+
+    start = time.time()
+    exact = np.array([[atmcorr.run_6s((band,) + tuple(point) + (date.month, date.day))
+                       for band in emulator.bands] for point, date in zip(points, dates)])
+    sixs = time.time() - start
+
+    error = np.abs(approx - exact) / np.maximum(np.abs(exact), 1e-6)
+    print("emulator: %.4fs, 6S: %.1fs for %d scenes x %d bands" % (emulated, sixs, n, len(emulator.bands)))
+    for o, name in enumerate(OUTPUTS):
+        print("%s relative error: mean %.4f max %.4f" % (name, error[:, :, o].mean(), error[:, :, o].max()))
+
+
+if __name__ == "__main__":
+
+    # python sixs_emulator.py build|benchmark sixs_emulator.npy
+    command, path = sys.argv[1], sys.argv[2]
+    if command == 'build':
+        build(path)
+    else:
+        benchmark(path)
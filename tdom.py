@@ -0,0 +1,121 @@
+# TDOM statistics helpers
+
+import ee
+import datetime
+import threading
+from utils import asset_exists
+
+# exports started by this process, so concurrent pipelines only start one per store
+_started = set()
+_lock = threading.Lock()
+
+
+def asset_id(root, sensor, regionName, epoch):
+    """ImageCollection holding the statistics of one (sensor, region, archive epoch).
+
+    Named TDOMStore_ rather than TDOM_: the TDOM_ assets of earlier runs are
+    single mean/stdDev images and cannot be read or extended as a store.
+    """
+    return root + "TDOMStore_" + sensor + "_" + regionName.replace(" ", "_") + "_" + str(epoch)
+
+
+def batch(collection, bands):
+    """Per-pixel count, mean and M2 (sum of squared deviations) of bands."""
+    reducer = ee.Reducer.count().combine(ee.Reducer.mean(), '', True).combine(ee.Reducer.variance(), '', True)
+    stats = collection.select(bands).reduce(reducer)
+
+    count = stats.select([band + "_count" for band in bands]).toFloat()
+    mean = stats.select([band + "_mean" for band in bands])
+    M2 = stats.select([band + "_variance" for band in bands]).multiply(count)
+
+    return count.addBands(mean).addBands(M2.rename([band + "_M2" for band in bands]))
+
+
+def merge(a, b, bands):
+    """Combine two sets of statistics over disjoint scenes (Chan et al. parallel Welford update)."""
+    countNames = [band + "_count" for band in bands]
+    meanNames = [band + "_mean" for band in bands]
+    M2Names = [band + "_M2" for band in bands]
+
+    na = a.select(countNames).unmask(0)
+    nb = b.select(countNames).unmask(0)
+    n = na.add(nb)
+
+    meanA = a.select(meanNames).unmask(0)
+    delta = b.select(meanNames).unmask(0).subtract(meanA)
+    mean = meanA.add(delta.multiply(nb).divide(n))
+    M2 = a.select(M2Names).unmask(0).add(b.select(M2Names).unmask(0)) \
+        .add(delta.pow(2).multiply(na).multiply(nb).divide(n))
+
+    return n.rename(countNames).addBands(mean.rename(meanNames)).addBands(M2.rename(M2Names)) \
+        .updateMask(n.gt(0))
+
+
+def derive(stats, bands):
+    """(mean, stdDev) images from count/mean/M2 statistics."""
+    count = stats.select([band + "_count" for band in bands])
+    mean = stats.select([band + "_mean" for band in bands])
+    stdDev = stats.select([band + "_M2" for band in bands]).divide(count).sqrt() \
+        .rename([band + "_stdDev" for band in bands])
+    return mean, stdDev
+
+
+def exporting(storeId):
+    """True while an export into the store, from any process, is still queued or running."""
+    name = storeId.split("/")[-1]
+    return any(task['description'].startswith(name) and task['state'] in ['UNSUBMITTED', 'READY', 'RUNNING']
+               for task in ee.data.getTaskList())
+
+
+def export(stats, storeId, region, crs, scale):
+    with _lock:
+        if storeId in _started:
+            return
+        _started.add(storeId)
+
+    if exporting(storeId):
+        return
+    if not asset_exists(storeId):
+        ee.data.createAsset({'type': 'ImageCollection'}, storeId)
+
+    name = storeId.split("/")[-1] + "_" + datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    task = ee.batch.Export.image.toAsset(image=stats,
+                                         description=name,
+                                         assetId=storeId + "/" + name,
+                                         region=region.bounds().getInfo()['coordinates'],
+                                         maxPixels=1e13,
+                                         crs=crs,
+                                         scale=scale)
+    task.start()
+
+
+def statistics(collection, bands, sensor, region, regionName, epoch, root, crs, scale):
+    """(mean, stdDev) images of bands, read from the stored statistics.
+
+    Every image of the store holds the per-pixel count, mean and M2 of all
+    scenes merged so far, and the system:index of the scenes it added
+    (sceneIds). Scenes whose id is in none of the images are reduced and
+    merged into the newest one, and the result is exported as a new image
+    of the store; tracking ids rather than acquisition time also picks up
+    scenes ingested late with an older date. Without a store for (sensor,
+    regionName, epoch), or while its first export is still running, the
+    whole collection is reduced; changing epoch starts a new store.
+    """
+    storeId = asset_id(root, sensor, regionName, epoch)
+    properties = {'sensor': sensor, 'region': regionName, 'epoch': str(epoch)}
+    stored = ee.ImageCollection(storeId)
+    # the collection is created before its first export has finished
+    if asset_exists(storeId) and stored.size().getInfo() > 0:
+        store = ee.Image(stored.sort('exportTime', False).first())
+        merged = stored.aggregate_array('sceneIds').flatten()
+        new = collection.filter(ee.Filter.inList('system:index', merged).Not())
+        if new.size().getInfo() > 0:
+            store = merge(store, batch(new, bands), bands).set(properties) \
+                .set({'sceneIds': new.aggregate_array('system:index'), 'exportTime': ee.Date(datetime.datetime.utcnow()).millis()})
+            export(store, storeId, region, crs, scale)
+    else:
+        store = batch(collection, bands).set(properties) \
+            .set({'sceneIds': collection.aggregate_array('system:index'), 'exportTime': ee.Date(datetime.datetime.utcnow()).millis()})
+        export(store, storeId, region, crs, scale)
+
+    return derive(store, bands)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# the tests never talk to Earth Engine
+import fake_ee
+sys.modules['ee'] = fake_ee
+
+import pytest
+
+
+@pytest.fixture
+def grid():
+    """Sets fake_ee.GRID to a lon/lat grid over a footprint and returns it."""
+    import angles_numpy
+
+    def make(footprint, shape=(120, 150)):
+        fake_ee.GRID = angles_numpy.grid(footprint, shape)
+        return fake_ee.GRID
+    yield make
+    fake_ee.GRID = None
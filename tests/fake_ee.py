@@ -0,0 +1,214 @@
+# stand-in for the ee module: records export tasks instead of starting them,
+# and evaluates Number/Image arithmetic on a NumPy lon/lat grid (GRID)
+
+import datetime
+import threading
+
+import numpy as np
+
+_lock = threading.Lock()
+
+
+class Task(object):
+    """Export task that stays RUNNING for `polls` task list calls after start."""
+
+    def __init__(self, config, polls=2):
+        self.config = config
+        self.polls = polls
+        self.started = False
+        self.id = None
+
+    def start(self):
+        with _lock:
+            self.started = True
+            self.id = 'TASK%d' % len([task for task in batch.tasks if task.started])
+
+    def _state(self):
+        if not self.started:
+            return 'UNSUBMITTED'
+        if self.polls > 0:
+            self.polls -= 1
+            return 'RUNNING'
+        return 'COMPLETED'
+
+    def status(self):
+        with _lock:
+            return {'state': self._state()}
+
+
+class data(object):
+    # tasks of the account not started through batch, as getTaskList rows
+    external = []
+
+    @staticmethod
+    def getTaskList():
+        with _lock:
+            return [{'id': task.id, 'state': task._state(), 'description': task.config.get('description', '')}
+                    for task in batch.tasks if task.started] + list(data.external)
+
+
+class _image(object):
+    @staticmethod
+    def toAsset(**config):
+        task = Task(config)
+        with _lock:
+            batch.tasks.append(task)
+        return task
+
+
+class _Export(object):
+    image = _image
+
+
+class batch(object):
+    Export = _Export
+    tasks = []
+
+
+def Initialize(*args, **kwargs):
+    pass
+
+
+def reset():
+    del batch.tasks[:]
+    del data.external[:]
+
+
+class EEException(Exception):
+    pass
+
+
+# (lon, lat) arrays returned by Image.pixelLonLat
+GRID = None
+
+
+def _array(value):
+    return value.values if isinstance(value, _Value) else np.asarray(value, dtype=np.float64)
+
+
+def _inside(ring, lon, lat):
+    result = np.zeros(np.shape(lon), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(ring[:-1], ring[1:]):
+        if y1 != y2:
+            crosses = (y1 > lat) != (y2 > lat)
+            result ^= crosses & (lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1))
+    return result
+
+
+class _Value(object):
+    """ee.Number and ee.Image alike: float arrays, NaN where masked."""
+
+    def __init__(self, values, bands=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        self.bands = bands
+
+    def _unary(function):
+        return lambda self: _Value(function(self.values))
+
+    def _binary(function):
+        return lambda self, other: _Value(function(self.values, _array(other)))
+
+    add = _binary(np.add)
+    subtract = _binary(np.subtract)
+    multiply = _binary(np.multiply)
+    divide = _binary(np.divide)
+    pow = _binary(np.power)
+    lt = _binary(lambda a, b: (a < b).astype(float))
+    lte = _binary(lambda a, b: (a <= b).astype(float))
+    gt = _binary(lambda a, b: (a > b).astype(float))
+    gte = _binary(lambda a, b: (a >= b).astype(float))
+    And = _binary(lambda a, b: ((a != 0) & (b != 0)).astype(float))
+    sqrt = _unary(np.sqrt)
+    abs = _unary(np.abs)
+    sin = _unary(np.sin)
+    cos = _unary(np.cos)
+    asin = _unary(np.arcsin)
+    acos = _unary(np.arccos)
+    atan = _unary(np.arctan)
+
+    def clamp(self, low, high):
+        return _Value(np.clip(self.values, low, high))
+
+    def mask(self, condition):
+        return _Value(np.where(_array(condition) != 0, self.values, np.nan))
+
+    def unmask(self, other):
+        return _Value(np.where(np.isnan(self.values), _array(other), self.values))
+
+    def clip(self, geometry):
+        lon, lat = GRID
+        return _Value(np.where(_inside(geometry.points, lon, lat), self.values, np.nan))
+
+    def select(self, name):
+        return _Value(self.bands[name])
+
+    def rename(self, names):
+        return self
+
+
+def Number(value):
+    return value if isinstance(value, _Value) else _Value(value)
+
+
+class Image(object):
+    def __new__(cls, value):
+        return Number(value)
+
+    @staticmethod
+    def pixelLonLat():
+        lon, lat = GRID
+        return _Value(lon, {'longitude': lon, 'latitude': lat})
+
+
+class _List(object):
+    def __init__(self, items):
+        self.items = items
+
+    def get(self, index):
+        item = self.items[int(_array(index))]
+        return _List(item) if isinstance(item, list) else Number(item)
+
+    def plain(self):
+        return [item.plain() if isinstance(item, _List) else item for item in self.items]
+
+
+def List(items):
+    return items if isinstance(items, _List) else _List(list(items))
+
+
+class _Date(object):
+    def __init__(self, date):
+        self.date = date
+
+    def getFraction(self, unit):
+        start = datetime.datetime(self.date.year, 1, 1)
+        return Number((self.date - start).total_seconds()
+                      / (datetime.datetime(self.date.year + 1, 1, 1) - start).total_seconds())
+
+    def getRelative(self, unit, inUnit):
+        return Number((self.date - datetime.datetime(self.date.year, self.date.month, self.date.day)).total_seconds())
+
+
+def Date(date):
+    return _Date(date)
+
+
+class _Geometry(object):
+    def __init__(self, points):
+        self.points = points
+
+    def centroid(self):
+        return _Geometry(list(np.mean(self.points, axis=0)))
+
+    def coordinates(self):
+        return _List(self.points)
+
+
+class Geometry(object):
+    @staticmethod
+    def Polygon(coordinates):
+        return _Geometry(List(coordinates).plain())
+
+    @staticmethod
+    def LineString(coordinates):
+        return _Geometry([point.plain() for point in List(coordinates).items])
@@ -0,0 +1,6 @@
+# synthetic swaths shared by the angle tests: a descending Landsat-like path and a near north-up one
+
+FOOTPRINTS = [
+    [[-79.05, -0.55], [-79.45, -2.20], [-77.80, -2.55], [-77.40, -0.90], [-79.05, -0.55]],
+    [[-78.90, 1.10], [-79.00, -0.60], [-77.25, -0.70], [-77.15, 1.00], [-78.90, 1.10]],
+]
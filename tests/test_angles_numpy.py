@@ -0,0 +1,49 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import ee
+import angles_numpy
+import sun_angles
+import view_angles
+from footprints import FOOTPRINTS
+
+DATES = [datetime.datetime(2018, 8, 14, 15, 20, 31), datetime.datetime(2016, 1, 3, 15, 41, 2)]
+
+
+def _compare(result, reference):
+    result = np.asarray(result, dtype=np.float64)
+    assert np.array_equal(np.isnan(result), np.isnan(reference))
+    valid = ~np.isnan(reference)
+    assert valid.sum() > 5000
+    # float32 output
+    assert np.allclose(result[valid], reference[valid], rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize('footprint', FOOTPRINTS)
+@pytest.mark.parametrize('date', DATES)
+def test_sun_matches_the_ee_formulas(grid, footprint, date):
+    lon, lat = grid(footprint)
+    (sunAz, sunZen) = sun_angles.create(ee.Date(date), ee.List(footprint))
+    (az, zen) = angles_numpy.sun(date, footprint, lon, lat, chunkSize=4096)
+    assert az.dtype == np.float32 and zen.dtype == np.float32
+    _compare(az, sunAz.values)
+    _compare(zen, sunZen.values)
+
+
+@pytest.mark.parametrize('footprint', FOOTPRINTS)
+def test_view_matches_the_analytic_ee_formulas(grid, footprint):
+    lon, lat = grid(footprint)
+    (viewAz, viewZen) = view_angles.create(ee.List(footprint), 'analytic')
+    (az, zen) = angles_numpy.view(footprint, lon, lat, chunkSize=4096)
+    _compare(zen, viewZen.values)
+    valid = ~np.isnan(zen)
+    assert np.allclose(az[valid], viewAz.values, atol=1e-5)
+
+
+def test_create_returns_all_four_grids(grid):
+    lon, lat = grid(FOOTPRINTS[0])
+    angles = angles_numpy.create(DATES[0], FOOTPRINTS[0], lon, lat)
+    assert sorted(angles) == ['sunAz', 'sunZen', 'viewAz', 'viewZen']
+    assert all(angles[name].shape == lon.shape for name in angles)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from assemblage import assemblage, compileTree, evaluateTreeNumpy
+
+NAMES = ['aquaculture', 'barren', 'cropland', 'forest']
+NODES = {'key1': {'band': 'aquaculture', 'threshold': 50, 'left': 'terminal', 'leftName': 'aquaculture', 'right': 'key2'},
+         'key2': {'band': 'barren', 'threshold': 40, 'left': 'terminal', 'leftName': 'barren', 'right': 'key3'},
+         'key3': {'band': 'cropland', 'threshold': 60, 'left': 'terminal', 'leftName': 'cropland', 'right': 'key4'},
+         'key4': {'band': 'forest', 'threshold': 5, 'left': 'terminal', 'leftName': 'other', 'right': 'terminal',
+                  'rightName': 'forest'}}
+
+
+def test_compiled_tree_follows_the_node_struct():
+    tree = compileTree(NODES, names=NAMES)
+    values = np.array([[60, 0, 0, 0], [0, 45, 0, 0], [0, 0, 70, 0], [0, 0, 0, 9], [0, 0, 0, 0]], dtype=float).T
+    leaves = evaluateTreeNumpy(tree, values)
+    assert [tree['classes'][leaf] for leaf in leaves] == ['aquaculture', 'barren', 'cropland', 'other', 'forest']
+
+
+def test_unknown_leaf_names_raise():
+    nodes = dict(NODES, key4=dict(NODES['key4'], rightName='mangrove'))
+    with pytest.raises(ValueError):
+        compileTree(nodes, names=NAMES)
+
+
+def test_ties_go_to_the_smallest_class_number():
+    # every pixel sits on the forest threshold, so with two iterations and
+    # noise either side the mode is a tie between forest (4), the first leaf
+    # in tree order, and 'other' (0)
+    nodes = dict(NODES, key4=dict(NODES['key4'], leftName='forest', rightName='other'))
+    stack = np.zeros((4, 1, 200), dtype=np.float32)
+    stack[3] = 5
+    mode, prob = assemblage().createAssemblageNumpy(stack, NAMES, nodes, sd=1, nIter=2)
+    tied = prob == 1
+    assert tied.any()
+    assert (mode[tied] == 0).all()
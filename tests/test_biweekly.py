@@ -0,0 +1,64 @@
+import threading
+
+import ee
+import biweekly
+
+
+def test_plan_covers_the_range():
+    periods = biweekly.plan(39, 105)
+    assert [p['week'] for p in periods] == list(range(39, 106))
+    assert periods[0]['startDay'] == 532 and periods[0]['endDay'] == 545
+    assert (periods[0]['endDate'] - periods[0]['startDate']).days == 13
+
+
+def test_export_name_matches_server_side_naming():
+    p = biweekly.period(39)
+    # 2015-06-17 and 2015-06-30, zero based days 167 and 180
+    assert biweekly.export_name('S2_BW_', 'AMAZONIA NOROCCIDENTAL', p['startDate'], p['endDate'], 39) \
+        == 'S2_BW_AMAZONIA_NOROCCIDENTAL_039_2015167180'
+
+
+def test_driver_submits_every_period_within_the_task_limit():
+    ee.reset()
+    queue = biweekly.TaskQueue(maxTasks=3, pollInterval=0.001)
+    peak = [0]
+    lock = threading.Lock()
+
+    def build(period):
+        task = ee.batch.Export.image.toAsset(description=biweekly.export_name('S2_BW_', 'TEST', period['startDate'],
+                                                                              period['endDate'], period['week']))
+        queue.submit(task)
+        with lock:
+            peak[0] = max(peak[0], len(queue.active))
+        return task.config['description']
+
+    names = biweekly.run(build, biweekly.plan(1, 20), workers=8)
+    queue.wait()
+
+    assert len(names) == 20 and len(set(names)) == 20
+    assert names[0] == 'S2_BW_TEST_001_2014000013'
+    assert len(ee.batch.tasks) == 20 and all(task.started for task in ee.batch.tasks)
+    assert len(queue.submitted) == 20
+    assert peak[0] <= 3
+    assert not queue.active
+
+
+def test_tasks_started_elsewhere_count_against_the_limit():
+    ee.reset()
+    # e.g. a TDOM and a terrain store export started with task.start()
+    ee.data.external.extend([{'id': 'TDOM', 'state': 'RUNNING', 'description': 'TDOMStore_S2'},
+                             {'id': 'TERRAIN', 'state': 'READY', 'description': 'Terrain_SRTM'}])
+    queue = biweekly.TaskQueue(maxTasks=3, pollInterval=0.001)
+    peak = [0]
+    lock = threading.Lock()
+
+    def build(period):
+        queue.submit(ee.batch.Export.image.toAsset(description=str(period['week'])))
+        with lock:
+            peak[0] = max(peak[0], len(queue.active))
+
+    biweekly.run(build, biweekly.plan(1, 6), workers=4)
+    queue.wait()
+
+    assert len(queue.submitted) == 6
+    assert peak[0] == 1
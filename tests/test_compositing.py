@@ -0,0 +1,63 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import compositing
+import medoids_numpy
+
+
+def _stack(nTime=7, size=40, seed=0):
+    rng = np.random.RandomState(seed)
+    stack = rng.uniform(0, 0.5, size=(nTime, 4, size, size)).astype(np.float32)
+    clear = rng.uniform(size=(nTime, size, size)) > 0.4
+    # a corner without any clear observation
+    clear[:, :3, :3] = False
+    return stack, clear
+
+
+def _median(stack, valid):
+    values = np.where(valid[:, None], stack, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(values, axis=0)
+
+
+def _same(result, reference):
+    assert np.array_equal(np.isnan(result), np.isnan(reference))
+    assert np.allclose(np.nan_to_num(result), np.nan_to_num(reference), atol=1e-6)
+
+
+@pytest.mark.parametrize('masked', [False, True])
+def test_tiled_medoid_matches_the_reference(masked):
+    stack, clear = _stack()
+    if masked:
+        inputs = (np.ma.masked_array(stack, np.broadcast_to(~clear[:, None], stack.shape)), None)
+    else:
+        inputs = (stack, clear)
+    result = compositing.composite(inputs[0], 'medoid', inputs[1], tileSize=16, workers=2)
+    _same(result, medoids_numpy._reference(stack, clear))
+
+
+@pytest.mark.parametrize('masked', [False, True])
+def test_tiled_median_matches_nanmedian(masked):
+    stack, clear = _stack(seed=1)
+    if masked:
+        inputs = (np.ma.masked_array(stack, np.broadcast_to(~clear[:, None], stack.shape)), None)
+    else:
+        inputs = (stack, clear)
+    result = compositing.composite(inputs[0], 'median', inputs[1], tileSize=16, workers=2)
+    _same(result, _median(stack, clear))
+
+
+def test_percentile_medoids_are_observations():
+    stack, clear = _stack(seed=2)
+    result = compositing.composite(stack, 'percentile', clear, percentiles=(20, 80), tileSize=16, workers=2)
+    assert result.shape == (2, 4, 40, 40)
+    assert np.isnan(result[:, :, :3, :3]).all()
+    # every band vector of the result is one of the clear observations of the pixel
+    for p in range(2):
+        distance = np.abs(stack - result[p][None]).sum(axis=1)
+        distance[~clear] = np.inf
+        found = distance.min(axis=0)
+        assert (found[clear.any(axis=0)] < 1e-6).all()
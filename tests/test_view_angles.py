@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import ee
+import angles_numpy
+import view_angles
+from footprints import FOOTPRINTS
+
+EARTH_RADIUS = 6371000.0
+
+
+def _cross_track(lon, lat, start, end):
+    """Great circle distance (m) of points to the line through start and end, as the distance transform."""
+    lon1, lat1 = np.radians(start)
+    lon2, lat2 = np.radians(end)
+    lon, lat = np.radians(lon), np.radians(lat)
+
+    def bearing(fromLon, fromLat, toLon, toLat):
+        return np.arctan2(np.sin(toLon - fromLon) * np.cos(toLat),
+                          np.cos(fromLat) * np.sin(toLat) - np.sin(fromLat) * np.cos(toLat) * np.cos(toLon - fromLon))
+
+    d13 = 2 * np.arcsin(np.sqrt(np.sin((lat - lat1) / 2) ** 2
+                                + np.cos(lat1) * np.cos(lat) * np.sin((lon - lon1) / 2) ** 2))
+    return np.abs(np.arcsin(np.sin(d13) * np.sin(bearing(lon1, lat1, lon, lat) - bearing(lon1, lat1, lon2, lat2)))) \
+        * EARTH_RADIUS
+
+
+def _distance_zenith(footprint, lon, lat):
+    """view_angles.zenith: the edge distances interpolated over the swath, in radians."""
+    left = _cross_track(lon, lat, footprint[angles_numpy.UPPER_LEFT], footprint[angles_numpy.LOWER_LEFT])
+    right = _cross_track(lon, lat, footprint[angles_numpy.UPPER_RIGHT], footprint[angles_numpy.LOWER_RIGHT])
+    zenith = right * angles_numpy.MAX_SATELLITE_ZENITH * 2 / (right + left) - angles_numpy.MAX_SATELLITE_ZENITH
+    return np.radians(zenith)
+
+
+@pytest.mark.parametrize('footprint', FOOTPRINTS)
+def test_analytic_zenith_agrees_with_distance_zenith(grid, footprint):
+    lon, lat = grid(footprint, (200, 200))
+    viewZen = view_angles.zenith_analytic(ee.List(footprint)).values
+    inside = np.isfinite(viewZen)
+    assert inside.sum() > 10000
+
+    reference = _distance_zenith(footprint, lon[inside], lat[inside])
+    difference = np.degrees(np.abs(viewZen[inside] - reference))
+    assert difference.max() < 0.01
+    assert np.degrees(np.abs(viewZen[inside])).max() <= angles_numpy.MAX_SATELLITE_ZENITH + 1e-3
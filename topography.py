@@ -0,0 +1,132 @@
+# terrain helpers
+
+import ee
+import json
+import os
+import threading
+from utils import asset_exists
+
+DEGREE2RADIAN = 0.01745
+
+# bands of the derivatives image
+BANDS = ['slope', 'slope_rad', 'aspect_rad', 'cosS', 'sinS']
+
+# derivatives per store id, shared by every pipeline running in this process
+_layers = {}
+_lock = threading.Lock()
+
+
+def asset_id(root, demName, regionName, crs, scale):
+    """Image holding the terrain derivatives of one (DEM, region, projection)."""
+    return root + "Terrain_" + demName + "_" + regionName.replace(" ", "_") + "_" \
+        + crs.replace(":", "") + "_" + str(scale)
+
+
+def compute(dem):
+    """Slope (degrees and radians), aspect (radians) and the cosine and sine of the slope."""
+    slope = ee.Terrain.slope(dem)
+    slope_rad = slope.multiply(DEGREE2RADIAN)
+    aspect_rad = ee.Terrain.aspect(dem).multiply(DEGREE2RADIAN)
+    return ee.Image.cat([slope, slope_rad, aspect_rad, slope_rad.cos(), slope_rad.sin()]).rename(BANDS).float()
+
+
+def export(layers, storeId, region, crs, scale):
+    task = ee.batch.Export.image.toAsset(image=layers,
+                                         description=storeId.split("/")[-1],
+                                         assetId=storeId,
+                                         region=region.getInfo()['coordinates'],
+                                         maxPixels=1e13,
+                                         crs=crs,
+                                         scale=scale)
+    task.start()
+
+
+def derivatives(dem, demName, region, regionName, root, crs, scale, buffer=10000):
+    """Terrain derivatives (BANDS) of dem over region, built once per region and projection.
+
+    The stack is read from the stored asset when it exists. Otherwise it is
+    computed from dem and exported, so later runs only read it; until then
+    the computed stack is clipped and reprojected like the stored one, so
+    the first run corrects the same pixels. Repeated calls in this process
+    return the same image, which keeps the per-image terrain correction
+    graph down to a select of the stored bands.
+    """
+    storeId = asset_id(root, demName, regionName, crs, scale)
+    with _lock:
+        if storeId not in _layers:
+            if asset_exists(storeId):
+                _layers[storeId] = ee.Image(storeId)
+            else:
+                exportRegion = region.bounds().buffer(buffer).bounds()
+                layers = compute(dem)
+                export(layers, storeId, exportRegion, crs, scale)
+                _layers[storeId] = layers.clip(exportRegion).reproject(crs, None, scale)
+        return _layers[storeId]
+
+
+def scsc(img_plus_ic, bands, geometry, scale, maxPixels=1e10):
+    """SCSc topographic correction of bands from one multi-output regression.
+
+    img_plus_ic carries the IC, cosS and cosZ bands and is masked to the
+    pixels the fit should use. A single linearRegression(2, len(bands)) over
+    [constant, IC, bands...] gives the intercept and slope of every band in
+    one pass; c = intercept / slope is applied to all bands at once. Without
+    a fit c falls back to 1.
+    """
+    n = len(bands)
+    out = ee.Image(1).addBands(img_plus_ic.select(['IC'] + bands)).reduceRegion(reducer=ee.Reducer.linearRegression(2, n),
+                                                                                geometry=geometry,
+                                                                                scale=scale,
+                                                                                bestEffort=True,
+                                                                                maxPixels=maxPixels)
+    fit = out.combine({"coefficients": ee.Array([[1] * n, [1] * n])}, False)
+
+    # row 0 holds the intercepts, row 1 the IC slopes
+    coefficients = ee.Array(fit.get('coefficients'))
+    cvalue = coefficients.slice(0, 0, 1).divide(coefficients.slice(0, 1, 2)).project([1])
+
+    return img_plus_ic.expression("((image * (cosB * cosZ + cvalue)) / (ic + cvalue))", {
+        'image': img_plus_ic.select(bands),
+        'ic': img_plus_ic.select('IC'),
+        'cosB': img_plus_ic.select('cosS'),
+        'cosZ': img_plus_ic.select('cosZ'),
+        'cvalue': ee.Image.constant(cvalue.toList())}).rename(bands)
+
+
+def tile_slopes(collection, dem, demName, path, percentile=80, scale=100):
+    """ee.Dictionary of MGRS_TILE -> percentile of slope for the tiles of a Sentinel-2 collection.
+
+    Tiles are fixed footprints, so the values are kept in a local JSON index
+    at path. Tiles not in the index yet are reduced together with one
+    reduceRegions over the bounds of the union of their scene footprints, so
+    a scene from the edge of a swath does not stand in for the whole tile,
+    and added to it. The index has a section per (demName, percentile,
+    scale), so changing any of them computes new values.
+    """
+    section = demName + "_p" + str(percentile) + "_" + str(scale)
+    with _lock:
+        store = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                store = json.load(f)
+        index = store.setdefault(section, {})
+
+        tiles = collection.aggregate_array('MGRS_TILE').distinct().getInfo()
+        missing = [tile for tile in tiles if tile not in index]
+        if missing:
+            def footprint(tile):
+                scenes = collection.filter(ee.Filter.eq('MGRS_TILE', tile))
+                return ee.Feature(scenes.geometry().bounds(), {'MGRS_TILE': tile})
+
+            slope = ee.Terrain.slope(dem.unmask(0))
+            rows = slope.reduceRegions(collection=ee.FeatureCollection(ee.List(missing).map(footprint)),
+                                       reducer=ee.Reducer.percentile([percentile]).setOutputs(['slope']),
+                                       scale=scale)
+            rows = rows.select(['MGRS_TILE', 'slope'], None, False).getInfo()['features']
+            for row in rows:
+                index[row['properties']['MGRS_TILE']] = row['properties'].get('slope')
+
+            with open(path, 'w') as f:
+                json.dump(store, f, indent=1, sort_keys=True)
+
+        return ee.Dictionary(dict((tile, index[tile]) for tile in tiles if index.get(tile) is not None))
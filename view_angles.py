@@ -4,7 +4,16 @@ from utils import *
 
 MAX_DISTANCE = 1000000
 
-def create(footprint):
+def create(footprint, zenithMethod='distance'):
+    """(viewAz, viewZen) images of the footprint.
+
+    zenithMethod 'distance' (the default) takes the distances to the
+    footprint edges from distance transforms; 'analytic' computes them in
+    closed form from pixelLonLat (zenith_analytic), which avoids the
+    distance transforms and agrees to within a hundredth of a degree.
+    """
+    if zenithMethod == 'analytic':
+        return (azimuth(footprint), zenith_analytic(footprint))
     return (azimuth(footprint), zenith(footprint))
 
 
@@ -28,3 +37,34 @@ def zenith(footprint):
         .clip(ee.Geometry.Polygon(footprint)) \
         .rename(['viewZen'])
     return degToRad(viewZenith)
+
+
+def zenith_analytic(footprint):
+    """Same interpolation as zenith, with the distances to the edge lines from pixelLonLat.
+
+    Longitudes are scaled by the cosine of the mean footprint latitude, which
+    makes the distances planar around the footprint; only their ratio is used.
+    """
+    lonLat = ee.Image.pixelLonLat()
+    meanLat = y(footprint.get(UPPER_LEFT)).add(y(footprint.get(LOWER_LEFT))) \
+        .add(y(footprint.get(LOWER_RIGHT))).add(y(footprint.get(UPPER_RIGHT))).divide(4)
+    lonScale = degToRad(meanLat).cos()
+
+    def distance(fromIndex, toIndex):
+        start = footprint.get(fromIndex)
+        end = footprint.get(toIndex)
+        dx = x(end).subtract(x(start)).multiply(lonScale)
+        dy = y(end).subtract(y(start))
+        length = dx.pow(2).add(dy.pow(2)).sqrt()
+        px = lonLat.select('longitude').subtract(x(start)).multiply(lonScale)
+        py = lonLat.select('latitude').subtract(y(start))
+        return px.multiply(dy).subtract(py.multiply(dx)).abs().divide(length)
+
+    leftDistance = distance(UPPER_LEFT, LOWER_LEFT)
+    rightDistance = distance(UPPER_RIGHT, LOWER_RIGHT)
+    viewZenith = rightDistance.multiply(ee.Number(MAX_SATELLITE_ZENITH * 2)) \
+        .divide(rightDistance.add(leftDistance)) \
+        .subtract(ee.Number(MAX_SATELLITE_ZENITH)) \
+        .clip(ee.Geometry.Polygon(footprint)) \
+        .rename(['viewZen'])
+    return degToRad(viewZenith)